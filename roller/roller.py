@@ -15,6 +15,8 @@ class Roller(commands.Cog):
 
     def __init__(self, bot: Red) -> None:
         self.bot = bot
+        # seconds spent in each startup phase, filled in by setup
+        self.startup_times = {}
 
     @commands.command(name="roll", help="output a random roll for a given combination of dice")
     async def roll(self, ctx: commands.Context, *input_string):
@@ -34,7 +36,11 @@ class Roller(commands.Cog):
 
         # if len(message_string) > MESSAGE_LENGTH_LIMIT:
         #     message_string = str(result)
-        await ctx.send(embed=embed)
+        # send through the Discord action queue shared by the Spim cog if it is loaded
+        if (actions := getattr(self.bot.get_cog('Spim'), 'actions', None)):
+            await actions.send(ctx, embed=embed)
+        else:
+            await ctx.send(embed=embed)
 
 def inside_paren(expr_string: str, index: int):
     """Determines if a given index in a string is inside a set of parentheses
@@ -1,13 +1,25 @@
 import json
+import logging
 from pathlib import Path
+from time import perf_counter
 
 from redbot.core.bot import Red
 
+# time spent importing the cog module, reported with the rest of startup
+_import_start = perf_counter()
 from .scheduler import Scheduler
+_import_time = perf_counter() - _import_start
 
 with open(Path(__file__).parent / "info.json") as fp:
     __red_end_user_data_statement__ = json.load(fp)["end_user_data_statement"]
 
+log = logging.getLogger('red.spim.scheduler')
+
 
 async def setup(bot: Red) -> None:
-    await bot.add_cog(Scheduler(bot))
+    start = perf_counter()
+    cog = Scheduler(bot)
+    cog.startup_times['import'] = _import_time
+    await bot.add_cog(cog)
+    cog.startup_times['setup'] = perf_counter() - start
+    log.info('Scheduler set up in %.1f ms (import %.1f ms)', cog.startup_times['setup'] * 1000, _import_time * 1000)
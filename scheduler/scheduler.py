@@ -1,14 +1,14 @@
+from contextlib import nullcontext
 from datetime import datetime
+from functools import partial
+from time import perf_counter
 import asyncio
+import logging
 from uuid import uuid4
-from pytimeparse import parse
-from pytz import timezone
-from iteration_utilities import grouper # type: ignore
-from dateutil import parser
 from json import load, dump
 from typing import Union
 
-from discord import Embed, AllowedMentions
+from discord import Embed, AllowedMentions, HTTPException
 from discord.ext import tasks
 from discord.utils import utcnow
 from redbot.core import commands, data_manager
@@ -18,12 +18,41 @@ from redbot.core.config import Config
 # default time string for new events
 DEFAULT_TIMESTR = 'Saturday at 3:00pm'
 
+log = logging.getLogger('red.spim.scheduler')
+
 class Scheduler(commands.Cog):
     """Scheduler for events and reminders"""
 
     def __init__(self, bot: Red) -> None:
+        init_start = perf_counter()
         self.bot = bot
         self.data_path = data_manager.cog_data_path(self) / 'events.json'
+        # filled in by load_data once the cog is loaded
+        self.events = {}
+        self.data_loader = None
+        # seconds spent in each startup phase, reported in the log once the data is loaded
+        self.startup_times = {'init': perf_counter() - init_start}
+        # direct requests standing in for queued ones that were cancelled, kept so they are not garbage collected
+        self.fallbacks = set()
+
+    async def cog_load(self):
+        # read the data file in the background so loading the cog does not wait on disk
+        self.data_loader = asyncio.create_task(self.load_data())
+
+    def cog_unload(self):
+        if self.data_loader:
+            self.data_loader.cancel()
+        self.check_event.cancel()
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        await self.wait_until_ready()
+
+    ####################
+    # HELPER FUNCTIONS #
+    ####################
+
+    def read_events(self):
+        """Read the events from disk, creating the data file if it does not exist"""
         try:
             with open(self.data_path) as data_file:
                 self.events = load(data_file)
@@ -31,16 +60,78 @@ class Scheduler(commands.Cog):
             self.events = {}
             with open(self.data_path, 'w') as data_file:
                 dump(self.events, data_file)
+
+    async def load_data(self):
+        """Read the events in a worker thread, start checking them, and log how long startup took"""
+        start = perf_counter()
+        await asyncio.to_thread(self.read_events)
+        self.startup_times['data'] = perf_counter() - start
         self.check_event.start()
-    
-    def cog_unload(self):
-        self.check_event.cancel()
+        log.info('Scheduler ready: %s', ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in self.startup_times.items()))
 
-    ####################
-    # HELPER FUNCTIONS #
-    ####################
+    async def wait_until_ready(self):
+        """Wait until the events have been loaded, raising the error if loading them failed"""
+        await asyncio.shield(self.data_loader)
+
+    def action_queue(self):
+        """Get the Discord action queue shared through the Spim cog
+
+        Return: the ActionQueue, or None if Spim is not loaded
+        """
+
+        return getattr(self.bot.get_cog('Spim'), 'actions', None)
+
+    def save_events(self):
+        """Write the events to disk, timed as file I/O by Spim's profiler if it is loaded"""
+        perf = getattr(self.bot.get_cog('Spim'), 'perf', None)
+        with perf.external('file') if perf else nullcontext():
+            with open(self.data_path, 'w') as json_file:
+                dump(self.events, json_file, indent=4)
+
+    def fall_back_if_cancelled(self, future: asyncio.Future, call):
+        """Make a queued request directly if the action queue cancels it, as Spim does with every pending request when it unloads
+
+        Keyword arguments:
+        future -- future returned by the action queue for the request
+        call -- coroutine function making the same request directly
+        """
+
+        def done(future):
+            if future.cancelled() or isinstance(future.exception(), asyncio.CancelledError):
+                task = asyncio.create_task(self.request_directly(call))
+                self.fallbacks.add(task)
+                task.add_done_callback(self.fallbacks.discard)
+        future.add_done_callback(done)
+
+    async def request_directly(self, call):
+        try:
+            await call()
+        except HTTPException as e:
+            log.warning('Discord request cancelled by the action queue failed when made directly', exc_info=e)
+
+    async def add_reactions(self, message, *emojis):
+        """Add reactions to a message through the shared action queue, without waiting for them if it is available"""
+        async def add():
+            for emoji in emojis:
+                await message.add_reaction(emoji)
+
+        if (actions := self.action_queue()):
+            # adding a reaction twice is harmless, so the fallback can redo reactions the queue already added
+            self.fall_back_if_cancelled(actions.add_reactions(message, list(emojis)), add)
+        else:
+            await add()
+
+    async def remove_reaction(self, message, emoji, member):
+        """Remove a member's reaction through the shared action queue, without waiting for it if it is available"""
+        remove = partial(message.remove_reaction, emoji, member)
+        if (actions := self.action_queue()):
+            self.fall_back_if_cancelled(actions.remove_reaction(message, emoji, member), remove)
+        else:
+            await remove()
 
     def new_event(self, **kwargs) -> dict[str, Union[str, int, bool, float, dict, None]]:
+        from dateutil import parser
+
         if 'channel_id' in kwargs:
             channel_id: int = kwargs['channel_id']
         else:
@@ -71,6 +162,11 @@ class Scheduler(commands.Cog):
         Return: tuple containing the event name and dict representing the event
         """
 
+        # these take a while to import, so wait until an event is actually scheduled
+        from dateutil import parser
+        from iteration_utilities import grouper # type: ignore
+        from pytimeparse import parse
+
         # pair up the positional arguments into a dict
         args_dict = {}
         for group in grouper(args, 2, fillvalue=None):
@@ -145,11 +241,9 @@ class Scheduler(commands.Cog):
         # save reminder message id to event data and output to json file
         message_id = message.id
         event['message-id'] = message_id
-        with open(self.data_path, 'w') as json_file:
-            dump(self.events, json_file, indent=4)
+        self.save_events()
         # add reactions to reminder message for users to indicate 'attending' or 'absent'
-        await message.add_reaction('<:spimPog:772261869858848779>')
-        await message.add_reaction('<:spon:922922345134424116>')
+        await self.add_reactions(message, '<:spimPog:772261869858848779>', '<:spon:922922345134424116>')
 
     async def send_event(self, name: str):
         event = self.events[name]
@@ -166,8 +260,7 @@ class Scheduler(commands.Cog):
         event = self.events.pop(name, None)
         if event:
             # update the json file
-            with open(self.data_path, 'w') as json_file:
-                dump(self.events, json_file, indent=4)
+            self.save_events()
             return True
         else:
             return False
@@ -186,8 +279,7 @@ class Scheduler(commands.Cog):
         self.events[name] = event
 
         # update event list in external file
-        with open(self.data_path, 'w') as json_file:
-            dump(self.events, json_file, indent=4)
+        self.save_events()
 
         # print event info to the chat
         await self.event_list(ctx, name)
@@ -240,6 +332,8 @@ class Scheduler(commands.Cog):
 
     @commands.command(name='message', parent=event, help='Schedule a message to send at specified time using `HH:MM` format')
     async def schedule_message(self, ctx, message, *time_string):
+        from dateutil import parser
+
         send_time = parser.parse(timestr=' '.join(time_string), fuzzy=True)
         current_time = datetime.now()
         send_delay = (send_time - datetime.now()).total_seconds()
@@ -254,30 +348,32 @@ class Scheduler(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
+        await self.wait_until_ready()
         user = payload.member
         emoji = payload.emoji
         message_id = payload.message_id
-        message = await self.bot.get_channel(payload.channel_id).fetch_message(message_id)
         if user.id != self.bot.user.id:
             for event in self.events.values():
                 if message_id == event['message-id']:
+                    # removing a reaction only needs the ids, so skip fetching the whole message
+                    message = self.bot.get_channel(payload.channel_id).get_partial_message(message_id)
                     if emoji.name == 'spimPog':
                         if user.id in event['absent']:
                             event['absent'].pop(user.id)
-                            await message.remove_reaction('<:spon:922922345134424116>', user)
+                            await self.remove_reaction(message, '<:spon:922922345134424116>', user)
                         if not user.id in event['attending']:
                             event['attending'][user.id] = user.display_name
                     elif emoji.name == 'spon':
                         if user.id in event['attending']:
                             event['attending'].pop(user.id)
-                            await message.remove_reaction('<:spimPog:772261869858848779>', user)
+                            await self.remove_reaction(message, '<:spimPog:772261869858848779>', user)
                         if not user.id in event['absent']:
                             event['absent'][user.id] = user.display_name
-                    with open(self.data_path, 'w') as json_file:
-                        dump(self.events, json_file, indent=4)
+                    self.save_events()
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
+        await self.wait_until_ready()
         user_id = payload.user_id
         emoji = payload.emoji
         message_id = payload.message_id
@@ -288,8 +384,7 @@ class Scheduler(commands.Cog):
                         event['attending'].pop(user_id, None)
                     elif emoji.name == 'spon':
                         event['absent'].pop(user_id, None)
-                    with open(self.data_path, 'w') as json_file:
-                        dump(self.events, json_file, indent=4)
+                    self.save_events()
 
     @tasks.loop(seconds=5.0)
     async def check_event(self):
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from collections import deque
+from contextvars import Context, copy_context
+from time import monotonic
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import discord
+
+log = logging.getLogger('red.spim.actions')
+
+# requests allowed per period for each route, per channel, matching Discord's published limits
+ROUTE_LIMITS = {
+    'send': (5, 5.0),
+    'edit': (5, 5.0),
+    'reaction': (1, 0.25),
+}
+
+
+class RouteBucket:
+    """Token bucket pacing requests to one rate limit route in one channel"""
+
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = monotonic()
+
+    async def acquire(self) -> None:
+        """Wait until a request can be made without being rate limited, then take a token"""
+
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+    def time_until_full(self) -> float:
+        """Get the number of seconds until every token has been given back"""
+
+        self._refill()
+        return (self.rate - self.tokens) * self.per / self.rate
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # callers are free to ignore their future and failures are already logged, so mark the exception as retrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class _Action:
+    """A queued Discord request and the future its caller waits on"""
+
+    def __init__(self, route: str, call: Callable[..., Awaitable], kwargs: dict, key: Optional[Hashable] = None) -> None:
+        self.route = route
+        self.call = call
+        self.kwargs = kwargs
+        self.key = key
+        # context of the caller, so time spent on the request is attributed to whoever queued it
+        self.context = copy_context()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_retrieve)
+
+
+class ActionQueue:
+    """Per-channel queue of Discord requests shared by every cog
+
+    Each route in each channel is worked through in order by its own task, paced by a RouteBucket so
+    bursts run as fast as Discord allows without hitting 429s, and reactions never hold up edits. Pending edits of the same message are coalesced
+    into one request and duplicate pending reactions are dropped. Every submission returns a future
+    that resolves to the result of the request, which callers can await or ignore.
+    """
+
+    def __init__(self) -> None:
+        # everything below is keyed by (channel id, route)
+        self._queues: dict[tuple[int, str], deque[_Action]] = {}
+        self._workers: dict[tuple[int, str], asyncio.Task] = {}
+        self._buckets: dict[tuple[int, str], RouteBucket] = {}
+        # actions that have not started yet and can absorb later duplicates, by key
+        self._pending: dict[Hashable, _Action] = {}
+
+    def send(self, destination: discord.abc.Messageable, **kwargs: Any) -> asyncio.Future:
+        """Queue a message to be sent to a channel or context
+
+        Return: future resolving to the sent discord.Message
+        """
+
+        return self._submit(self._channel_id(destination), _Action('send', destination.send, kwargs))
+
+    def edit(self, message: discord.Message, **kwargs: Any) -> asyncio.Future:
+        """Queue an edit of a message, merged into any edit of the same message that has not started yet
+
+        Return: future resolving to the edited discord.Message
+        """
+
+        key = ('edit', message.id)
+        if key in self._pending:
+            action = self._pending[key]
+            action.kwargs.update(kwargs)
+            return action.future
+        return self._submit(message.channel.id, _Action('edit', message.edit, kwargs, key))
+
+    def add_reactions(self, message: discord.abc.Snowflake, emojis: list) -> asyncio.Future:
+        """Queue reactions to be added to a message, in order
+
+        Return: future resolving once every reaction has been added
+        """
+
+        futures = []
+        for emoji in emojis:
+            key = ('add_reaction', message.id, str(emoji))
+            if key in self._pending:
+                futures.append(self._pending[key].future)
+            else:
+                futures.append(self._submit(message.channel.id, _Action('reaction', message.add_reaction, {'emoji': emoji}, key)))
+        batch = asyncio.gather(*futures)
+        batch.add_done_callback(_retrieve)
+        return batch
+
+    def remove_reaction(self, message: discord.abc.Snowflake, emoji, member: discord.abc.Snowflake) -> asyncio.Future:
+        """Queue the removal of a member's reaction from a message
+
+        Return: future resolving once the reaction has been removed
+        """
+
+        key = ('remove_reaction', message.id, str(emoji), member.id)
+        if key in self._pending:
+            return self._pending[key].future
+        return self._submit(message.channel.id, _Action('reaction', message.remove_reaction, {'emoji': emoji, 'member': member}, key))
+
+    def close(self) -> None:
+        """Stop every worker and cancel every action that has not run yet"""
+
+        for worker in self._workers.values():
+            worker.cancel()
+        for queue in self._queues.values():
+            for action in queue:
+                action.future.cancel()
+        self._workers.clear()
+        self._queues.clear()
+        self._buckets.clear()
+        self._pending.clear()
+
+    def _channel_id(self, destination) -> int:
+        # contexts and interactions wrap the channel they send to
+        channel = getattr(destination, 'channel', None) or destination
+        return channel.id
+
+    def _submit(self, channel_id: int, action: _Action) -> asyncio.Future:
+        if action.key is not None:
+            self._pending[action.key] = action
+        key = (channel_id, action.route)
+        self._queues.setdefault(key, deque()).append(action)
+        if key not in self._workers:
+            if key not in self._buckets:
+                self._buckets[key] = RouteBucket(*ROUTE_LIMITS[action.route])
+            # workers are shared by every caller, so they start from an empty context rather than the first caller's
+            self._workers[key] = Context().run(asyncio.create_task, self._work(key))
+        return action.future
+
+    async def _work(self, key: tuple[int, str]) -> None:
+        queue = self._queues[key]
+        bucket = self._buckets[key]
+        while queue:
+            action = queue[0]
+            if action.future.cancelled():
+                queue.popleft()
+                self._pending.pop(action.key, None)
+                continue
+            # the action can still absorb duplicates while it waits for its bucket
+            await bucket.acquire()
+            queue.popleft()
+            self._pending.pop(action.key, None)
+            try:
+                # tasks copy the context they are created in, so the request runs in the caller's
+                result = await action.context.run(asyncio.create_task, action.call(**action.kwargs))
+            except asyncio.CancelledError:
+                action.future.cancel()
+                raise
+            except Exception as e:
+                log.warning('Discord %s request in channel %s failed', action.route, key[0], exc_info=e)
+                if not action.future.done():
+                    action.future.set_exception(e)
+            else:
+                if not action.future.done():
+                    action.future.set_result(result)
+        del self._queues[key]
+        del self._workers[key]
+        # a new bucket starts full, so this one can be forgotten once it has refilled without letting any extra requests through
+        asyncio.get_running_loop().call_later(bucket.time_until_full(), self._prune, key)
+
+    def _prune(self, key: tuple[int, str]) -> None:
+        if key in self._workers or key not in self._buckets:
+            return
+        delay = self._buckets[key].time_until_full()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._prune, key)
+        else:
+            del self._buckets[key]
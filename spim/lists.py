@@ -0,0 +1,424 @@
+from collections import Counter
+from difflib import SequenceMatcher
+from itertools import islice
+from json import load, dump, dumps, loads
+from typing import Optional
+import asyncio
+import logging
+import os
+
+import discord
+from discord import ui
+
+log = logging.getLogger('red.spim.lists')
+
+
+class TrigramIndex:
+    """Case-insensitive trigram index over the items of every list, for substring and fuzzy search
+
+    Items are padded with a space on each side before being split into trigrams, so items shorter than three characters are indexed too.
+    """
+
+    # number of the query's rarest trigrams used to pick fuzzy candidates
+    FUZZY_TRIGRAMS = 8
+    # most items counted from any one posting when picking fuzzy candidates, so common trigrams cost the same at any list size
+    POSTING_CAP = 1000
+
+    def __init__(self) -> None:
+        # trigram -> set of (list name, item)
+        self.postings: dict[str, set[tuple[str, str]]] = {}
+        # every one and two character substring of an indexed trigram -> trigrams containing it, for queries too short to have a trigram
+        self.short: dict[str, set[str]] = {}
+
+    @staticmethod
+    def trigrams(text: str, pad: bool = True) -> set[str]:
+        text = text.lower()
+        if pad:
+            text = f' {text} '
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    @staticmethod
+    def short_grams(trigram: str) -> set[str]:
+        return {trigram[i:i + length] for length in (1, 2) for i in range(4 - length)}
+
+    def add(self, name: str, item: str) -> None:
+        for trigram in self.trigrams(item):
+            if trigram not in self.postings:
+                self.postings[trigram] = set()
+                for gram in self.short_grams(trigram):
+                    self.short.setdefault(gram, set()).add(trigram)
+            self.postings[trigram].add((name, item))
+
+    def remove(self, name: str, item: str) -> None:
+        for trigram in self.trigrams(item):
+            posting = self.postings.get(trigram)
+            if posting is not None:
+                posting.discard((name, item))
+                if not posting:
+                    del self.postings[trigram]
+                    for gram in self.short_grams(trigram):
+                        self.short[gram].discard(trigram)
+                        if not self.short[gram]:
+                            del self.short[gram]
+
+    def substring(self, query: str, limit: Optional[int] = None) -> list[tuple[str, str]]:
+        """Get the (list name, item) pairs containing the query, ignoring case
+
+        Keyword arguments:
+        query -- text to search for
+        limit -- optional number of matches to stop at, so common queries do not walk every item
+        Return: list of (list name, item) tuples, in no particular order
+        """
+
+        query = query.lower()
+        if not query:
+            return []
+        if len(query) < 3:
+            # too short to have a trigram of its own, walk the postings of the trigrams that contain it, smallest first
+            postings = sorted((self.postings[trigram] for trigram in self.short.get(query, ())), key=len)
+            candidates = (match for posting in postings for match in posting)
+            others = []
+        else:
+            # walk the smallest posting and check the others, so the cost follows the rarest trigram of the query
+            postings = sorted((self.postings.get(trigram, set()) for trigram in self.trigrams(query, pad=False)), key=len)
+            candidates, others = postings[0], postings[1:]
+        matches, seen = [], set()
+        for match in candidates:
+            if match in seen or not all(match in posting for posting in others) or query not in match[1].lower():
+                continue
+            seen.add(match)
+            matches.append(match)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+    def fuzzy(self, query: str, threshold: float = 0.6, candidates: int = 100) -> list[tuple[float, str, str]]:
+        """Get the items most similar to the query
+            Items sharing the most of the query's rarest trigrams are picked as candidates, then scored by edit similarity.
+
+        Keyword arguments:
+        query -- text to search for
+        threshold -- minimum similarity ratio between the query and an item, from 0 to 1
+        candidates -- number of items sharing the most trigrams with the query to score
+        Return: list of (similarity, list name, item) tuples, most similar first
+        """
+
+        query = query.lower()
+        postings = sorted((self.postings[trigram] for trigram in self.trigrams(query) if trigram in self.postings), key=len)
+        shared: Counter = Counter()
+        for posting in postings[:self.FUZZY_TRIGRAMS]:
+            shared.update(islice(posting, self.POSTING_CAP))
+        matcher = SequenceMatcher(b=query, autojunk=False)
+        matches = []
+        for (name, item), _ in shared.most_common(candidates):
+            matcher.set_seq1(item.lower())
+            similarity = matcher.ratio()
+            if similarity >= threshold:
+                matches.append((similarity, name, item))
+        matches.sort(key=lambda match: -match[0])
+        return matches
+
+
+class ListStore:
+    """Named lists of items, kept in memory and persisted as one append-only journal per list
+
+    Each list is a dict of item to the number of times it was added, so adding and removing an item is O(1)
+    and only the changed list's journal is written to. Journals that have grown well past their list are
+    rewritten as a snapshot by `compact_if_due`, in a worker thread.
+    """
+
+    # rewrite a journal once it holds more than twice as many entries as its list has items, plus this many
+    COMPACT_SLACK = 256
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None) -> None:
+        """
+        Keyword arguments:
+        path -- directory holding the list journals and their index
+        legacy_path -- optional lists.json written by older versions, imported the first time the store is loaded
+        """
+
+        self.path = path
+        self.legacy_path = legacy_path
+        self.index_path = os.path.join(path, 'index.json')
+        self.lists: dict[str, dict[str, int]] = {}
+        # list name -> journal file name
+        self.files: dict[str, str] = {}
+        # number of entries in each journal, used to decide when to compact it
+        self.journal_sizes: dict[str, int] = {}
+        # list name -> entries journaled since its snapshot was taken, for lists being compacted, or None if the list was deleted meanwhile
+        self._compacting: dict[str, Optional[list[dict]]] = {}
+        self.index = TrigramIndex()
+
+    def load(self) -> None:
+        """Read every list from disk, importing the legacy lists.json if the store does not exist yet"""
+
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self.index_path) as index_file:
+                self.files = load(index_file)
+        except FileNotFoundError:
+            self.files = {}
+            legacy = {}
+            if self.legacy_path:
+                try:
+                    with open(self.legacy_path) as list_file:
+                        legacy = load(list_file)
+                except FileNotFoundError:
+                    pass
+            for name, items in legacy.items():
+                self.files[name] = self._new_file_name()
+                self.lists[name] = {}
+                self._count(self.lists[name], items)
+                self._compact(name)
+            self._write_index()
+            self._build_index()
+            return
+
+        for name, file_name in self.files.items():
+            self.lists[name] = {}
+            self.journal_sizes[name] = 0
+            try:
+                with open(os.path.join(self.path, file_name)) as journal:
+                    for line in journal:
+                        self._replay(name, loads(line))
+            except FileNotFoundError:
+                pass
+            if self._compaction_due(name):
+                self._compact(name)
+        self._build_index()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.lists
+
+    def names(self) -> list[str]:
+        return list(self.lists)
+
+    def size(self, name: str) -> int:
+        """Get the number of distinct items in a list"""
+
+        return len(self.lists[name])
+
+    def page(self, name: str, page: int, page_size: int) -> list[tuple[str, int]]:
+        """Get one page of a list
+
+        Keyword arguments:
+        name -- name of the list
+        page -- index of the page, starting at 0
+        page_size -- number of items per page
+        Return: list of (item, count) tuples in the order the items were first added
+        """
+
+        start = page * page_size
+        return list(islice(self.lists[name].items(), start, start + page_size))
+
+    def add(self, name: str, items: list[str]) -> None:
+        """Add items to a list, creating the list if it does not exist"""
+
+        if name not in self.lists:
+            self.lists[name] = {}
+            self.files[name] = self._new_file_name()
+            self.journal_sizes[name] = 0
+            self._write_index()
+        for item in items:
+            if item not in self.lists[name]:
+                self.index.add(name, item)
+        self._count(self.lists[name], items)
+        if items:
+            self._append(name, {'add': items})
+
+    def missing(self, name: str, items: list[str]) -> list[str]:
+        """Get the items that are not in a list"""
+
+        return [item for item in items if item not in self.lists[name]]
+
+    def remove(self, name: str, items: list[str]) -> None:
+        """Remove every copy of the given items from a list"""
+
+        for item in items:
+            if self.lists[name].pop(item, None) is not None:
+                self.index.remove(name, item)
+        if items:
+            self._append(name, {'remove': items})
+
+    def delete(self, name: str) -> None:
+        """Delete a list and its journal"""
+
+        for item in self.lists.pop(name):
+            self.index.remove(name, item)
+        self.journal_sizes.pop(name, None)
+        if name in self._compacting:
+            self._compacting[name] = None
+        file_name = self.files.pop(name)
+        self._write_index()
+        try:
+            os.remove(os.path.join(self.path, file_name))
+        except FileNotFoundError:
+            pass
+
+    async def compact_if_due(self, name: str) -> None:
+        """Rewrite a list's journal as a single snapshot if it has grown well past the list
+            The snapshot is written in a worker thread, and entries journaled meanwhile are appended to it before it replaces the journal.
+        """
+
+        if name not in self.lists or name in self._compacting or not self._compaction_due(name):
+            return
+        path = os.path.join(self.path, self.files[name])
+        # copy on the loop so the worker thread never sees the list change while writing it
+        snapshot = {'items': dict(self.lists[name])}
+        self._compacting[name] = []
+        try:
+            await asyncio.to_thread(self._write_snapshot, path + '.tmp', snapshot)
+        except OSError as e:
+            # the journal is untouched, so the list is safe and compaction is tried again after the next change
+            log.warning('Compacting list %s failed', name, exc_info=e)
+            self._compacting.pop(name)
+            return
+        entries = self._compacting.pop(name)
+        if entries is None:
+            os.remove(path + '.tmp')
+            return
+        with open(path + '.tmp', 'a') as journal:
+            for entry in entries:
+                journal.write(dumps(entry) + '\n')
+        os.replace(path + '.tmp', path)
+        self.journal_sizes[name] = 1 + len(entries)
+
+    def search(self, query: str, limit: int = 25) -> list[tuple[str, str]]:
+        """Find items containing the query in any list, followed by items that fuzzily match it
+            Stops looking for substring matches once it has `limit`, so the shortest matches come first among those found, not among every match.
+
+        Keyword arguments:
+        query -- text to search for, case-insensitive
+        limit -- maximum number of results
+        Return: list of (list name, item) tuples
+        """
+
+        results = sorted(self.index.substring(query, limit), key=lambda match: (len(match[1]), match))
+        if len(results) < limit:
+            found = set(results)
+            for _, name, item in self.index.fuzzy(query):
+                if (name, item) not in found:
+                    results.append((name, item))
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def _build_index(self) -> None:
+        self.index = TrigramIndex()
+        for name, items in self.lists.items():
+            for item in items:
+                self.index.add(name, item)
+
+    def _count(self, counts: dict[str, int], items: list[str]) -> None:
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+
+    def _replay(self, name: str, entry: dict) -> None:
+        if 'add' in entry:
+            self._count(self.lists[name], entry['add'])
+        if 'remove' in entry:
+            for item in entry['remove']:
+                self.lists[name].pop(item, None)
+        if 'items' in entry:
+            self.lists[name].update(entry['items'])
+        self.journal_sizes[name] += 1
+
+    def _append(self, name: str, entry: dict) -> None:
+        with open(os.path.join(self.path, self.files[name]), 'a') as journal:
+            journal.write(dumps(entry) + '\n')
+        self.journal_sizes[name] += 1
+        if self._compacting.get(name) is not None:
+            self._compacting[name].append(entry)
+
+    def _compaction_due(self, name: str) -> bool:
+        # proportional to the list, so the cost of writing each snapshot is spread over as many appends as it has items
+        return self.journal_sizes[name] > 2 * len(self.lists[name]) + self.COMPACT_SLACK
+
+    def _compact(self, name: str) -> None:
+        # write the list as a single snapshot entry, then swap it in so a crash never leaves a partial journal
+        path = os.path.join(self.path, self.files[name])
+        self._write_snapshot(path + '.tmp', {'items': self.lists[name]})
+        os.replace(path + '.tmp', path)
+        self.journal_sizes[name] = 1
+
+    def _write_snapshot(self, path: str, entry: dict) -> None:
+        with open(path, 'w') as journal:
+            journal.write(dumps(entry) + '\n')
+
+    def _new_file_name(self) -> str:
+        used = set(self.files.values())
+        number = len(used)
+        while f'{number}.jsonl' in used:
+            number += 1
+        return f'{number}.jsonl'
+
+    def _write_index(self) -> None:
+        with open(self.index_path, 'w') as index_file:
+            dump(self.files, index_file, indent=4)
+
+
+class ListView(ui.View):
+    """Paginated display of a single list, rendering each page only when it is shown"""
+
+    PAGE_SIZE = 20
+    # longest item text shown, keeps a full page under the embed description limit
+    ITEM_LENGTH = 180
+
+    def __init__(self, store: ListStore, name: str, color: discord.Color, timeout: float = 180) -> None:
+        super().__init__(timeout=timeout)
+        self.store = store
+        self.name = name
+        self.color = color
+        self.page = 0
+        self.message = None
+
+    def page_count(self) -> int:
+        if self.name not in self.store:
+            return 1
+        return max(1, -(-self.store.size(self.name) // self.PAGE_SIZE))
+
+    def embed(self) -> discord.Embed:
+        """Render the current page"""
+
+        if self.name not in self.store:
+            return discord.Embed(description='List not found', color=self.color)
+        self.page = min(self.page, self.page_count() - 1)
+        lines = []
+        for item, count in self.store.page(self.name, self.page, self.PAGE_SIZE):
+            if len(item) > self.ITEM_LENGTH:
+                item = item[:self.ITEM_LENGTH - 1] + '…'
+            if count > 1:
+                lines.append(f"• {item} (×{count})")
+            else:
+                lines.append(f"• {item}")
+        embed = discord.Embed(title=self.name, description='\n'.join(lines), color=self.color)
+        if self.page_count() > 1:
+            embed.set_footer(text=f"Page {self.page + 1}/{self.page_count()}")
+        return embed
+
+    async def send(self, ctx) -> None:
+        """Send the first page, with navigation buttons if the list has more than one page"""
+
+        if self.page_count() > 1:
+            self.message = await ctx.send(embed=self.embed(), view=self)
+        else:
+            self.stop()
+            await ctx.send(embed=self.embed())
+
+    async def on_timeout(self) -> None:
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                # the message was deleted or can no longer be edited, so there are no buttons left to remove
+                pass
+
+    @ui.button(label='◀', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: ui.Button) -> None:
+        self.page = (self.page - 1) % self.page_count()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @ui.button(label='▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: ui.Button) -> None:
+        self.page = (self.page + 1) % self.page_count()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
@@ -0,0 +1,434 @@
+import asyncio
+import functools
+import sys
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+from contextvars import ContextVar
+from time import monotonic, perf_counter, sleep, time
+from typing import Any, Awaitable, Optional
+
+# names of the cogs in this repository, the only ones PerfRecorder instruments
+INSTRUMENTED_COGS = ('Roller', 'Scheduler', 'Spim')
+# top level package of each cog, used to tell which cog a stack frame belongs to
+COG_PACKAGES = {'roller': 'Roller', 'scheduler': 'Scheduler', 'spim': 'Spim'}
+
+
+class Histogram:
+    """Fixed-size histogram of durations, with buckets doubling from 1 ms up to about two minutes"""
+
+    BOUNDS = [0.001 * 2 ** i for i in range(18)]
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Estimate a percentile as the upper bound of the bucket it falls in
+
+        Keyword arguments:
+        fraction -- percentile to estimate, from 0 to 1
+        Return: estimated duration in seconds, never more than the largest recorded duration
+        """
+
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Sample:
+    """Timings and API calls collected during a single command or listener call"""
+
+    def __init__(self) -> None:
+        self.blocking = 0.0
+        self.external: Counter = Counter()
+        # AWS operation name -> number of calls
+        self.api_calls: Counter = Counter()
+
+
+class Profile:
+    """Timings accumulated by every call of one command or listener"""
+
+    def __init__(self, cog: str, name: str) -> None:
+        self.cog = cog
+        self.name = name
+        self.wall = Histogram()
+        self.blocking = Histogram()
+        # kind of external call -> total seconds
+        self.external: Counter = Counter()
+        # AWS operation name -> total number of calls
+        self.api_calls: Counter = Counter()
+
+    def record(self, wall: float, sample: Sample) -> None:
+        self.wall.add(wall)
+        self.blocking.add(sample.blocking)
+        self.external.update(sample.external)
+        self.api_calls.update(sample.api_calls)
+
+
+class _External:
+    """Times a block of code as an external call of the given kind, usable with `with` and `async with`"""
+
+    def __init__(self, recorder: 'PerfRecorder', kind: str) -> None:
+        self.recorder = recorder
+        self.kind = kind
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        sample = self.recorder.current.get()
+        if sample is not None:
+            sample.external[self.kind] += perf_counter() - self.start
+
+    async def __aenter__(self) -> None:
+        self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
+
+
+class _StepTimer:
+    """Awaitable that runs a coroutine and adds the time spent in each of its steps to a sample
+
+    The time between two suspension points is time the coroutine held the event loop, so the sum is how long it blocked the loop.
+    """
+
+    def __init__(self, recorder: 'PerfRecorder', label: tuple[str, str], coro: Awaitable, sample: Sample) -> None:
+        self.recorder = recorder
+        self.label = label
+        self.coro = coro
+        self.sample = sample
+
+    def __await__(self):
+        steps = self.coro.__await__()
+        value, error = None, None
+        while True:
+            start = perf_counter()
+            # lets StallWatchdog tell which command is holding the loop
+            previous, self.recorder.stepping = self.recorder.stepping, self.label
+            try:
+                if error is not None:
+                    yielded = steps.throw(error)
+                else:
+                    yielded = steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.recorder.stepping = previous
+                self.sample.blocking += perf_counter() - start
+            value, error = None, None
+            try:
+                value = yield yielded
+            except BaseException as e:
+                error = e
+
+
+class PerfRecorder:
+    """Records wall time, event loop blocking time, and external call time for every command and listener in this repository's cogs
+
+    Commands, app commands and context menus are instrumented by wrapping their callbacks, and listeners by re-registering them wrapped.
+    Discord REST time is measured by wrapping the bot's HTTP client, and the cogs mark EC2 calls and file I/O with `external`.
+    """
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.profiles: dict[tuple[str, str], Profile] = {}
+        # sample of the command or listener running in the current context
+        self.current: ContextVar[Optional[Sample]] = ContextVar('spim_perf_sample', default=None)
+        # id of instrumented cog -> (cog, [(command, callback attribute, original callback)], [(event, original listener, wrapper)])
+        self._instrumented: dict[int, tuple[Any, list, list]] = {}
+        self._http_request = None
+        # (cog, name) of the command or listener whose code is running on the loop right now, if any
+        self.stepping: Optional[tuple[str, str]] = None
+
+    def watch(self, client) -> None:
+        """Count every request made by a boto3 client against the command or listener making it
+
+        Worker threads started with asyncio.to_thread share the caller's context, so calls made from them are counted too.
+        Calls made outside of any command or listener, such as by a background poller, are not counted.
+        """
+
+        def count(model, **kwargs):
+            sample = self.current.get()
+            if sample is not None:
+                sample.api_calls[model.name] += 1
+
+        client.meta.events.register('before-call', count)
+
+    def external(self, kind: str) -> _External:
+        """Time a block of code as an external call of the given kind, such as 'ec2', 'discord' or 'file'"""
+
+        return _External(self, kind)
+
+    async def run(self, cog: str, name: str, coro: Awaitable) -> Any:
+        """Await a coroutine, recording its timings under the given cog and command or listener name"""
+
+        key = (cog, name)
+        if key not in self.profiles:
+            self.profiles[key] = Profile(cog, name)
+        sample = Sample()
+        token = self.current.set(sample)
+        start = perf_counter()
+        try:
+            return await _StepTimer(self, key, coro, sample)
+        finally:
+            self.profiles[key].record(perf_counter() - start, sample)
+            self.current.reset(token)
+
+    def install(self) -> None:
+        """Start timing Discord REST calls and instrument every cog from this repository that is already loaded"""
+
+        original = self.bot.http.request
+
+        async def request(*args, **kwargs):
+            with self.external('discord'):
+                return await original(*args, **kwargs)
+
+        self._http_request = (original, request)
+        self.bot.http.request = request
+        for name in INSTRUMENTED_COGS:
+            cog = self.bot.get_cog(name)
+            if cog is not None:
+                self.instrument(cog)
+
+    def uninstall(self) -> None:
+        """Undo every wrapper installed by `install` and `instrument`"""
+
+        if self._http_request is not None:
+            original, request = self._http_request
+            if self.bot.http.request is request:
+                self.bot.http.request = original
+            self._http_request = None
+        for cog, commands, listeners in self._instrumented.values():
+            if self.bot.get_cog(cog.qualified_name) is not cog:
+                continue
+            for command, attribute, callback in commands:
+                setattr(command, attribute, callback)
+            for event, listener, wrapper in listeners:
+                self.bot.remove_listener(wrapper, event)
+                self.bot.add_listener(listener, event)
+        self._instrumented.clear()
+
+    def instrument(self, cog, listeners: bool = True) -> None:
+        """Wrap the commands and listeners of a cog so their timings are recorded
+
+        Keyword arguments:
+        cog -- cog to instrument, ignored if it is not from this repository or is already instrumented
+        listeners -- whether to wrap listeners too, which must already be registered with the bot
+        """
+
+        if cog.qualified_name not in INSTRUMENTED_COGS or id(cog) in self._instrumented:
+            return
+        # drop cogs that have been unloaded since they were instrumented
+        for cog_id, (old_cog, _, _) in list(self._instrumented.items()):
+            if self.bot.get_cog(old_cog.qualified_name) is not old_cog:
+                del self._instrumented[cog_id]
+
+        wrapped_commands = []
+        for command in cog.walk_commands():
+            callback = command.callback
+            command.callback = self._wrap_callback(cog.qualified_name, command.qualified_name, callback)
+            wrapped_commands.append((command, 'callback', callback))
+        for command in cog.walk_app_commands():
+            # groups have no callback of their own, only the commands in them
+            if hasattr(command, '_callback'):
+                wrapped_commands.append(self._wrap_app_command(cog.qualified_name, command))
+
+        wrapped_listeners = []
+        if listeners:
+            for event, listener in cog.get_listeners():
+                wrapper = self._wrap_listener(cog, event, listener)
+                self.bot.remove_listener(listener, event)
+                self.bot.add_listener(wrapper, event)
+                wrapped_listeners.append((event, listener, wrapper))
+
+        self._instrumented[id(cog)] = (cog, wrapped_commands, wrapped_listeners)
+
+    def instrument_app_command(self, cog, command) -> None:
+        """Wrap an app command or context menu that is registered outside of a cog, timing it under that cog
+
+        Keyword arguments:
+        cog -- cog the command belongs to, which must already be instrumented, its wrapper is removed along with the cog's
+        command -- app command or context menu to instrument
+        """
+
+        if id(cog) in self._instrumented:
+            self._instrumented[id(cog)][1].append(self._wrap_app_command(cog.qualified_name, command))
+
+    def _wrap_callback(self, cog: str, name: str, callback):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            return await self.run(cog, name, callback(*args, **kwargs))
+        return wrapper
+
+    def _wrap_app_command(self, cog: str, command) -> tuple:
+        # app commands and context menus only expose their callback read-only, and call the private attribute directly
+        callback = command._callback
+        command._callback = self._wrap_callback(cog, getattr(command, 'qualified_name', command.name), callback)
+        return (command, '_callback', callback)
+
+    def _wrap_listener(self, cog, event: str, listener):
+        async def wrapper(*args, **kwargs):
+            if self.bot.get_cog(cog.qualified_name) is not cog:
+                # the cog was unloaded and only removed its unwrapped listener, so clean up after it
+                self.bot.remove_listener(wrapper, event)
+                return
+            return await self.run(cog.qualified_name, event, listener(*args, **kwargs))
+        return wrapper
+
+
+def collapse_stack(frame) -> str:
+    """Format a stack as `module:function` entries from the outermost call to the innermost, separated by semicolons"""
+
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def sample_stacks(thread_id: int, duration: float, interval: float = 0.005) -> Counter:
+    """Repeatedly sample the stack of another thread, meant to be run in a worker thread
+
+    Keyword arguments:
+    thread_id -- id of the thread to sample, usually the one running the event loop
+    duration -- number of seconds to sample for
+    interval -- number of seconds between samples
+    Return: Counter of collapsed stacks to the number of times they were seen
+    """
+
+    stacks: Counter = Counter()
+    end = monotonic() + duration
+    while monotonic() < end:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[collapse_stack(frame)] += 1
+        del frame
+        sleep(interval)
+    return stacks
+
+
+class Stall:
+    """A period during which the event loop was blocked, with the stack that was blocking it"""
+
+    def __init__(self, started: float, stack: list[str], cog: Optional[str], command: Optional[str], where: Optional[str]) -> None:
+        # wall clock time the stall started at
+        self.started = started
+        # set once the loop is running again
+        self.duration: Optional[float] = None
+        # formatted frames, outermost first
+        self.stack = stack
+        self.cog = cog
+        self.command = command
+        # innermost frame belonging to one of this repository's cogs
+        self.where = where
+
+
+class StallWatchdog:
+    """Measures event loop lag continuously and records the stack of whatever blocks the loop for too long
+
+    A task on the loop beats every `interval` seconds, and a separate thread watches the beats. When they stop for longer than `threshold`,
+    the thread captures the loop thread's stack and attributes it to the cog owning the innermost frame and to the command PerfRecorder
+    reports as running. The stall is recorded, with its full duration, once the loop beats again.
+    """
+
+    def __init__(self, recorder: PerfRecorder, threshold: float = 0.2, interval: float = 0.05, history: int = 50) -> None:
+        """
+        Keyword arguments:
+        recorder -- PerfRecorder used to tell which command is running
+        threshold -- number of seconds the loop has to be blocked for to count as a stall
+        interval -- number of seconds between beats
+        history -- number of stalls kept
+        """
+
+        self.recorder = recorder
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = Histogram()
+        self.stalls: deque[Stall] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        # stall the watcher thread has captured but the loop has not come back from yet
+        self._open: Optional[Stall] = None
+        self._beat = 0.0
+        self._loop_thread = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running event loop"""
+
+        self._loop_thread = threading.get_ident()
+        self._beat = monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+        threading.Thread(target=self._watch, name='spim-stall-watchdog', daemon=True).start()
+
+    def stop(self) -> None:
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        self._stopped.set()
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            expected = monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+            lag = max(0.0, now - expected)
+            self.lag.add(lag)
+            self._beat = now
+            with self._lock:
+                stall, self._open = self._open, None
+            if stall is not None:
+                stall.duration = lag
+                self.stalls.append(stall)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            blocked = monotonic() - self._beat - self.interval
+            if blocked < self.threshold:
+                continue
+            with self._lock:
+                if self._open is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                self._open = self._capture(frame, time() - blocked)
+                del frame
+
+    def _capture(self, frame, started: float) -> Stall:
+        cog, where = None, None
+        inner = frame
+        while inner is not None:
+            module = inner.f_globals.get('__name__', '')
+            # skip the profiling wrappers, which are on the stack of every instrumented command
+            if module != __name__ and module.split('.')[0] in COG_PACKAGES:
+                cog = COG_PACKAGES[module.split('.')[0]]
+                where = f'{module}:{inner.f_code.co_name}:{inner.f_lineno}'
+                break
+            inner = inner.f_back
+        command = None
+        stepping = self.recorder.stepping
+        if stepping is not None:
+            command = stepping[1]
+            cog = cog or stepping[0]
+        # reading source lines here would mean file I/O on every capture, the file and line number are enough
+        summary = traceback.StackSummary.extract(traceback.walk_stack(frame), limit=20, lookup_lines=False)
+        stack = [f'{entry.filename}:{entry.lineno} in {entry.name}' for entry in reversed(summary)]
+        return Stall(started, stack, cog, command, where)
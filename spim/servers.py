@@ -0,0 +1,252 @@
+import asyncio
+import logging
+from contextvars import Context
+from time import monotonic
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+# states an instance only passes through, polled quickly so users see the result within seconds
+TRANSITIONAL_STATES = {'pending', 'stopping', 'shutting-down'}
+# shortest delay between polls, used while instances are changing state
+MIN_POLL_INTERVAL = 5.0
+# consecutive failed refreshes after which subscribers holding cached servers are handed the error
+MAX_FAILURES = 3
+
+log = logging.getLogger('red.spim.servers')
+
+
+class ServerRecord(NamedTuple):
+    """The parts of an EC2 instance description used by the server commands"""
+
+    inst_id: str
+    name: str
+    status: str
+    url: str
+    region: str
+
+
+def filter_key(filters: list) -> tuple:
+    """Build a hashable key for a list of describe_instances filters
+
+    Keyword arguments:
+    filters -- array of filters in the format accepted by describe_instances
+    Return: tuple that is equal for filters matching the same instances, regardless of order
+    """
+
+    return tuple(sorted((f['Name'], tuple(sorted(f['Values']))) for f in filters))
+
+
+class _CacheEntry:
+    """Cached instance state for a single set of filters"""
+
+    def __init__(self, filters: list) -> None:
+        self.filters = filters
+        self.servers: Optional[list] = None
+        self.error: Optional[Exception] = None
+        # refreshes that have failed in a row since the last successful one
+        self.failures = 0
+        self.fetched_at = 0.0
+        # incremented every time a refresh changes the servers or keeps failing, so subscribers only wake for news
+        self.version = 0
+        self.updated = asyncio.Condition()
+        # current delay between polls, doubled while nothing changes and reset on any change
+        self.backoff = MIN_POLL_INTERVAL
+        self.wake = asyncio.Event()
+        # in-flight refresh shared by every caller asking for this entry
+        self.refresh: Optional[asyncio.Future] = None
+        # polling intervals requested by each open subscription
+        self.intervals: list[float] = []
+        self.poller: Optional[asyncio.Task] = None
+
+
+class InstanceStateCache:
+    """Shared cache of EC2 instance state, keyed by describe_instances filters
+
+    Concurrent refreshes of the same filters are coalesced into a single call to `fetch`,
+    and results younger than `ttl` seconds are served from the cache.
+    """
+
+    def __init__(self, fetch: Callable[[list], Awaitable[list]], ttl: float = 15.0) -> None:
+        """
+        Keyword arguments:
+        fetch -- coroutine function taking a list of filters and returning the matching servers
+        ttl -- number of seconds a result is considered fresh
+        """
+
+        self.fetch = fetch
+        self.ttl = ttl
+        self._entries: dict[tuple, _CacheEntry] = {}
+
+    def _entry(self, filters: list) -> _CacheEntry:
+        key = filter_key(filters)
+        if key not in self._entries:
+            # filters come from user input, so drop unused entries before adding one to keep the cache bounded
+            self._evict()
+            self._entries[key] = _CacheEntry(filters)
+        return self._entries[key]
+
+    def _evict(self) -> None:
+        now = monotonic()
+        for key, entry in list(self._entries.items()):
+            if not entry.intervals and entry.refresh is None and now - entry.fetched_at > self.ttl:
+                del self._entries[key]
+
+    async def get(self, filters: list, max_age: Optional[float] = None) -> list:
+        """Get the servers matching the given filters, refreshing them if the cached copy is too old
+
+        Keyword arguments:
+        filters -- array of filters in the format accepted by describe_instances
+        max_age -- maximum age in seconds of an acceptable cached result, defaults to the cache ttl
+        Return: list of servers
+        """
+
+        if max_age is None:
+            max_age = self.ttl
+        entry = self._entry(filters)
+        if entry.servers is not None and monotonic() - entry.fetched_at <= max_age:
+            return entry.servers
+        return await self._refresh(entry)
+
+    def invalidate(self) -> None:
+        """Mark every cached result as stale so the next request refreshes it
+            Open subscriptions are refreshed right away and go back to polling quickly.
+        """
+
+        for entry in self._entries.values():
+            entry.fetched_at = 0.0
+            entry.backoff = MIN_POLL_INTERVAL
+            entry.wake.set()
+
+    def subscribe(self, filters: list, interval: float, duration: Optional[float] = None) -> 'Subscription':
+        """Subscribe to state changes for the given filters
+            Polling speeds up while instances are in a transitional state and backs off up to `interval` while they are stable.
+
+        Keyword arguments:
+        filters -- array of filters in the format accepted by describe_instances
+        interval -- longest number of seconds between refreshes while this subscription is open
+        duration -- optional number of seconds after which iteration stops
+        Return: async context manager that iterates over the current servers and then every changed list of servers
+        """
+
+        return Subscription(self, self._entry(filters), interval, duration)
+
+    def close(self) -> None:
+        """Stop every background poller"""
+
+        for entry in self._entries.values():
+            if entry.poller:
+                entry.poller.cancel()
+                entry.poller = None
+
+    async def _refresh(self, entry: _CacheEntry) -> list:
+        if entry.refresh is None:
+            # run in a fresh context, the refresh is shared so it does not belong to whichever command started it
+            entry.refresh = Context().run(asyncio.create_task, self._fetch(entry))
+        # shield the shared refresh so one cancelled caller does not cancel it for everyone else
+        return await asyncio.shield(entry.refresh)
+
+    async def _fetch(self, entry: _CacheEntry) -> list:
+        try:
+            servers = await self.fetch(entry.filters)
+        except Exception as e:
+            entry.refresh = None
+            entry.failures += 1
+            log.warning('Refreshing servers failed (%d in a row)', entry.failures, exc_info=e)
+            # keep handing out the last good servers through transient errors such as throttling, the poller retries
+            if entry.servers is None or entry.failures >= MAX_FAILURES:
+                entry.error = e
+                await self._notify(entry)
+            raise
+        entry.refresh = None
+        changed = servers != entry.servers or entry.error is not None
+        if changed or any(server.status in TRANSITIONAL_STATES for server in servers):
+            entry.backoff = MIN_POLL_INTERVAL
+        elif entry.intervals:
+            entry.backoff = min(entry.backoff * 2, max(entry.intervals))
+        entry.servers = servers
+        entry.error = None
+        entry.failures = 0
+        entry.fetched_at = monotonic()
+        if changed:
+            await self._notify(entry)
+        return servers
+
+    async def _notify(self, entry: _CacheEntry) -> None:
+        entry.version += 1
+        async with entry.updated:
+            entry.updated.notify_all()
+
+    def _poll_interval(self, entry: _CacheEntry) -> float:
+        return min(entry.backoff, *entry.intervals)
+
+    async def _poll(self, entry: _CacheEntry) -> None:
+        while entry.intervals:
+            delay = entry.fetched_at + self._poll_interval(entry) - monotonic()
+            if delay > 0:
+                # sleep until the next poll is due, or until invalidate() asks for one early
+                entry.wake.clear()
+                try:
+                    await asyncio.wait_for(entry.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._refresh(entry)
+            except Exception:
+                # the error is logged, and handed to subscribers through the entry if it keeps failing, try again next interval
+                await asyncio.sleep(self._poll_interval(entry))
+
+
+class Subscription:
+    """Open subscription to an `InstanceStateCache` entry
+
+    Use as `async with cache.subscribe(filters, interval) as updates: async for servers in updates: ...`
+    """
+
+    def __init__(self, cache: InstanceStateCache, entry: _CacheEntry, interval: float, duration: Optional[float] = None) -> None:
+        self.cache = cache
+        self.entry = entry
+        self.interval = interval
+        self.duration = duration
+        self._deadline: Optional[float] = None
+        self._version: Optional[int] = None
+
+    async def __aenter__(self) -> 'Subscription':
+        if self.duration is not None:
+            self._deadline = monotonic() + self.duration
+        self.entry.intervals.append(self.interval)
+        if self.entry.poller is None or self.entry.poller.done():
+            # the poller outlives the command that opened the subscription, so do not inherit its context
+            self.entry.poller = Context().run(asyncio.create_task, self.cache._poll(self.entry))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.entry.intervals.remove(self.interval)
+        if not self.entry.intervals and self.entry.poller:
+            self.entry.poller.cancel()
+            self.entry.poller = None
+            self.cache._evict()
+
+    def __aiter__(self) -> 'Subscription':
+        return self
+
+    async def __anext__(self) -> list:
+        entry = self.entry
+        if self._version is None:
+            # first iteration, hand out the cached state right away if it is fresh enough
+            servers = await self.cache.get(entry.filters)
+            self._version = entry.version
+            return servers
+        timeout = None
+        if self._deadline is not None:
+            timeout = self._deadline - monotonic()
+            if timeout <= 0:
+                raise StopAsyncIteration
+        try:
+            async with entry.updated:
+                await asyncio.wait_for(entry.updated.wait_for(lambda: entry.version != self._version), timeout)
+        except asyncio.TimeoutError:
+            raise StopAsyncIteration
+        self._version = entry.version
+        if entry.error is not None:
+            raise entry.error
+        return entry.servers
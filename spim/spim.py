@@ -1,10 +1,13 @@
 from typing import Literal, Text, Union, TypedDict
+from collections import Counter
 from datetime import datetime, timedelta
-from time import strftime
 from json import load, dump
 from random import shuffle
+from time import localtime, perf_counter, strftime
 import asyncio
+import logging
 import os
+import threading
 
 import discord
 from discord import CategoryChannel, ForumChannel, MessageReference, Thread, Reaction, ui
@@ -14,32 +17,41 @@ from redbot.core import commands, app_commands, data_manager
 from redbot.core.bot import Red
 from redbot.core.config import Config
 
-import boto3, botocore
+from .actions import ActionQueue
+from .lists import ListStore, ListView
+from .perf import PerfRecorder, StallWatchdog, sample_stacks
+from .servers import InstanceStateCache, ServerRecord
 
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
 
+log = logging.getLogger('red.spim.spim')
+
+# region used if none has been configured
+DEFAULT_REGION = 'us-west-2'
+# maximum number of instance ids sent in one start_instances or stop_instances request
+INSTANCE_BATCH_SIZE = 50
+# error codes caused by one instance of a batch rather than by the request, worth splitting the batch to find that instance
+INSTANCE_ERROR_CODES = {'IncorrectSpotRequestState', 'IncorrectInstanceState', 'InsufficientInstanceCapacity'}
+
 
 class Spim(commands.Cog):
     """Cogs for Red-DiscordBot V3 for use in Gear Getaway"""
 
+    # longest number of seconds between checks while set_status waits for servers to stop
+    STATUS_INTERVAL = 60
+    # longest number of seconds between refreshes of a server list, and how long it keeps updating
+    LIST_INTERVAL = 20
+    LIST_DURATION = 2*60
+
     def __init__(self, bot: Red) -> None:
+        init_start = perf_counter()
         self.server_config_path = os.path.join(data_manager.cog_data_path(self), 'server-config.json')
-        self.list_path = os.path.join(data_manager.cog_data_path(self), 'lists.json')
+        self.list_path = os.path.join(data_manager.cog_data_path(self), 'lists')
 
-        try:
-            with open(self.server_config_path) as server_config_file:
-                self.server_config = load(server_config_file)
-        except FileNotFoundError:
-            self.server_config = {}
-            with open(self.server_config_path, 'w') as server_config_file:
-                dump(self.server_config, server_config_file, indent=4)
-        try:
-            with open(self.list_path) as list_file:
-                self.lists = load(list_file)
-        except FileNotFoundError:
-            self.lists = {}
-            with open(self.list_path, 'w') as list_file:
-                dump(self.lists, list_file, indent=4)
+        # filled in by load_data once the cog is loaded
+        self.server_config = {}
+        self.lists = ListStore(self.list_path, legacy_path=os.path.join(data_manager.cog_data_path(self), 'lists.json'))
+        self.data_loader = None
 
         self.bot = bot
         self.config = Config.get_conf(
@@ -48,17 +60,44 @@ class Spim(commands.Cog):
             force_registration=True,
         )
 
-        if 'region' in self.server_config:
-            self.boto_config = botocore.config.Config(
-                region_name = self.server_config['region']
-            )
-        else:
-            # set region to default if no region found in data file
-            self.boto_config = botocore.config.Config(
-                region_name = 'us-west-2'
-            )
+        # one client per region, created on first use and shared by every worker thread
+        self.ec2_clients = {}
+        self.ec2_clients_lock = threading.Lock()
 
         self.server_names = []
+        # region -> error of the last refresh, for regions that could not be reached
+        self.region_errors = {}
+        # shared by every server command so concurrent lists and status loops make one set of API calls
+        self.server_cache = InstanceStateCache(self.fetch_servers)
+        # Discord requests from every cog go through here, see ActionQueue
+        self.actions = ActionQueue()
+        # times every command and listener in this repository's cogs, see PerfRecorder
+        self.perf = PerfRecorder(bot)
+        self.watchdog = StallWatchdog(self.perf)
+
+        # seconds spent in each startup phase, reported in the log once the data is loaded
+        self.startup_times = {'init': perf_counter() - init_start}
+
+    async def cog_load(self):
+        # read the data files in the background so loading the cog does not wait on disk
+        self.data_loader = asyncio.create_task(self.load_data())
+        self.perf.install()
+        # listeners are not registered until after cog_load, and Spim's own are not worth timing
+        self.perf.instrument(self, listeners=False)
+        # the context menu lives outside the cog, so it is not found by instrument
+        self.perf.instrument_app_command(self, spimify)
+        self.watchdog.start()
+
+    def cog_unload(self):
+        if self.data_loader:
+            self.data_loader.cancel()
+        self.watchdog.stop()
+        self.perf.uninstall()
+        self.server_cache.close()
+        self.actions.close()
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        await self.wait_until_ready()
 
     async def red_delete_data_for_user(self, *, requester: RequestType, user_id: int) -> None:
         # TODO: Replace this with the proper end user data removal handling.
@@ -70,106 +109,272 @@ class Spim(commands.Cog):
     ####################
 
 
-    def get_server_list(self, filters=[]):
-        """Get the list of all EC2 instances names, DNS names, and statuses with the given filters
+    def read_data_files(self):
+        """Read the server config and lists from disk, creating the server config if it does not exist"""
+
+        try:
+            with open(self.server_config_path) as server_config_file:
+                self.server_config = load(server_config_file)
+        except FileNotFoundError:
+            self.server_config = {}
+            with open(self.server_config_path, 'w') as server_config_file:
+                dump(self.server_config, server_config_file, indent=4)
+        self.lists.load()
+
+    def save_server_config(self):
+        """Write the server config to disk"""
+
+        with self.perf.external('file'):
+            with open(self.server_config_path, 'w') as server_config_file:
+                dump(self.server_config, server_config_file, indent=4)
+
+    async def load_data(self):
+        """Read the data files in a worker thread and log how long startup took"""
+
+        start = perf_counter()
+        await asyncio.to_thread(self.read_data_files)
+        self.startup_times['data'] = perf_counter() - start
+        log.info('Spim ready: %s', ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in self.startup_times.items()))
+
+    async def wait_until_ready(self):
+        """Wait until the data files have been loaded, raising the error if loading them failed"""
+
+        await asyncio.shield(self.data_loader)
+
+    def server_filters(self, *server_names):
+        """Get the describe_instances filters for servers managed by Spim
+
+        Keyword arguments:
+        server_names -- optional list of server names to filter by
+        Return: array of filters
+        """
+
+        filters = [ {
+            'Name': 'tag:Spim-Managed',
+            'Values': [ 'true' ]
+        } ]
+        if server_names:
+            filters.append({
+                'Name': 'tag:Name',
+                'Values': list(server_names)
+            })
+        return filters
+
+    def regions(self):
+        """Get the regions to manage servers in
+
+        Return: list of region names, defaults to DEFAULT_REGION if none are configured
+        """
+
+        if 'regions' in self.server_config:
+            return self.server_config['regions']
+        return [self.server_config.get('region', DEFAULT_REGION)]
+
+    def ec2_client(self, region):
+        """Get the EC2 client for the given region, creating it if needed
+            Creating clients is not thread safe, so it is guarded by a lock, but the clients themselves are.
+
+        Keyword arguments:
+        region -- name of the region
+        Return: boto3 EC2 client
+        """
+
+        # boto3 takes a while to import, so wait until a server command needs it
+        import boto3, botocore.config
+
+        with self.ec2_clients_lock:
+            if region not in self.ec2_clients:
+                self.ec2_clients[region] = boto3.client('ec2', config=botocore.config.Config(region_name=region))
+                self.perf.watch(self.ec2_clients[region])
+            return self.ec2_clients[region]
+
+    def iter_servers(self, filters=[], region=DEFAULT_REGION):
+        """Stream the name, status, DNS name, and id of every EC2 instance in a region matching the given filters
+            Follows every page of describe_instances, so memory stays bounded by the page size.
+
+        Keyword arguments:
+        filters -- array of filters, applied server-side, defaults to no filters
+        region -- name of the region to search, defaults to DEFAULT_REGION
+        Return: generator of ServerRecord
+        """
+
+        PAGE_SIZE = 1000
+
+        ec2 = self.ec2_client(region)
+        paginator = ec2.get_paginator('describe_instances')
+
+        for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': PAGE_SIZE}):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    inst_id = instance['InstanceId']
+                    # fall back to the instance id for instances without a Name tag
+                    name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), inst_id)
+                    yield ServerRecord(inst_id, name, instance['State']['Name'], instance.get('PublicDnsName', ''), region)
+
+    def get_server_list(self, filters=[], region=DEFAULT_REGION):
+        """Get the list of all EC2 instances names, DNS names, and statuses in a region with the given filters
         
         Keyword arguments:
         filters -- array of filters, defaults to no filters
+        region -- name of the region to search, defaults to DEFAULT_REGION
         Return: list of servers
         """
-        
-        ec2 = boto3.client('ec2', config=self.boto_config)
 
-        try:
-            ec2.describe_instances(Filters=filters, DryRun=True)
-        except botocore.exceptions.ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                raise e
-        # Dry run succeeded, call describe_instances without dryrun
-        try:
-            response = ec2.describe_instances(Filters=filters, DryRun=False)
-        except botocore.exceptions.ClientError as e:
-            raise e
-
-        output = []
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                tag = dict()
-                for tag in instance['Tags']:
-                    if tag['Key'] == 'Name':
-                        break
-                name = tag['Value']
-                status = instance['State']['Name']
-                url = instance['PublicDnsName']
-                inst_id = instance['InstanceId']
-                output += [(inst_id, name, status, url)]
+        return list(self.iter_servers(filters, region))
 
-        return output
+    async def fetch_servers(self, filters=[]):
+        """Get the servers matching the given filters in every configured region
+            Regions are queried concurrently, so this takes as long as the slowest region.
+            Regions that fail are left out and recorded in region_errors, the error is only raised if every region fails.
+
+        Keyword arguments:
+        filters -- array of filters, defaults to no filters
+        Return: list of servers, in the order of the configured regions
+        """
 
-    def start_instance(self, inst_id):
-        """Start the EC2 instance with the specified instance id
+        regions = self.regions()
+        async with self.perf.external('ec2'):
+            results = await asyncio.gather(*(asyncio.to_thread(self.get_server_list, filters, region) for region in regions), return_exceptions=True)
+        region_errors = {}
+        for region, result in zip(regions, results):
+            if isinstance(result, Exception):
+                log.warning('Listing servers in %s failed', region, exc_info=result)
+                region_errors[region] = result
+        self.region_errors = region_errors
+        if len(region_errors) == len(regions):
+            raise results[0]
+        return [server for servers in results if not isinstance(servers, Exception) for server in servers]
+
+    async def unknown_regions(self, regions):
+        """Get the regions EC2 is not available in, in any partition
 
         Keyword arguments:
-        inst_id -- the id of the instance to start
-        Return: the response of ec2.start_instances for the given instance id
+        regions -- list of region names to check
+        Return: list of the region names that are not known
         """
 
-        ec2 = boto3.client('ec2', config=self.boto_config)
+        def available_regions():
+            # boto3 takes a while to import, and reading its endpoint data is file I/O, so keep both off the loop
+            import boto3
+
+            # the default session is the one the EC2 clients are created from, so its endpoint data is already parsed
+            with self.ec2_clients_lock:
+                if boto3.DEFAULT_SESSION is None:
+                    boto3.setup_default_session()
+                session = boto3.DEFAULT_SESSION
+            return {
+                region
+                for partition in session.get_available_partitions()
+                for region in session.get_available_regions('ec2', partition_name=partition)
+            }
+
+        available = await asyncio.to_thread(available_regions)
+        return [region for region in regions if region not in available]
+
+    def change_instance_batch(self, action, region, inst_ids):
+        """Start or stop a batch of EC2 instances in a single request
+            If the request fails because of one of its instances, the batch is split in half and each half retried, so one failure does not abort the rest.
+            Any other error, such as throttling or missing permissions, would fail the same way for every instance and is not retried.
+
+        Keyword arguments:
+        action -- either 'start' or 'stop'
+        region -- name of the region the instances are in
+        inst_ids -- list of instance ids, at most INSTANCE_BATCH_SIZE long
+        Return: tuple of the list of instance state changes and a dict of instance id to the error that stopped it from changing
+        """
+
+        from botocore.exceptions import ClientError
+
+        ec2 = self.ec2_client(region)
+        if action == 'start':
+            call, key = ec2.start_instances, 'StartingInstances'
+        else:
+            call, key = ec2.stop_instances, 'StoppingInstances'
 
         try:
-            ec2.start_instances(InstanceIds=[inst_id], DryRun=True)
-        except botocore.exceptions.ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                raise e
-        # Dry run succeeded, call start_instances without dryrun
-        try:
-            response = ec2.start_instances(InstanceIds=[inst_id], DryRun=False)
-        except botocore.exceptions.ClientError as e:
-            raise e
+            return call(InstanceIds=inst_ids)[key], {}
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if len(inst_ids) == 1 or not (code in INSTANCE_ERROR_CODES or code.startswith('InvalidInstanceID.')):
+                return [], {inst_id: e for inst_id in inst_ids}
+
+        changes, errors = [], {}
+        half = len(inst_ids) // 2
+        for part in (inst_ids[:half], inst_ids[half:]):
+            part_changes, part_errors = self.change_instance_batch(action, region, part)
+            changes += part_changes
+            errors.update(part_errors)
+        return changes, errors
+
+    async def change_instances(self, action, servers):
+        """Start or stop EC2 instances, grouped by region and split into concurrent batches at the API limit
 
-        return response
+        Keyword arguments:
+        action -- either 'start' or 'stop'
+        servers -- list of servers to change
+        Return: tuple of the list of instance state changes and a dict of instance id to the error that stopped it from changing
+        """
+
+        by_region = {}
+        for server in servers:
+            by_region.setdefault(server.region, []).append(server.inst_id)
+        batches = [
+            (region, inst_ids[i:i + INSTANCE_BATCH_SIZE])
+            for region, inst_ids in by_region.items()
+            for i in range(0, len(inst_ids), INSTANCE_BATCH_SIZE)
+        ]
+        async with self.perf.external('ec2'):
+            results = await asyncio.gather(*(asyncio.to_thread(self.change_instance_batch, action, region, batch) for region, batch in batches))
+        self.server_cache.invalidate()
+
+        changes, errors = [], {}
+        for batch_changes, batch_errors in results:
+            changes += batch_changes
+            errors.update(batch_errors)
+        return changes, errors
+
+    async def send_instance_errors(self, ctx: commands.Context, servers, errors):
+        """Send a message explaining why some servers could not be started or stopped
+
+        Keyword arguments:
+        servers -- list of servers the errors refer to
+        errors -- dict of instance id to the error raised for that instance
+        """
+
+        lines = []
+        for server in servers:
+            if server.inst_id in errors:
+                error = errors[server.inst_id].response['Error']
+                if error['Code'] == 'IncorrectSpotRequestState':
+                    lines.append(f'{server.name}: No Spot capacity available at the moment. Please try again in a few minutes.')
+                else:
+                    lines.append(f"{server.name}: {error['Message']}")
+        await ctx.send('```' + '\n'.join(lines) + '```')
 
     async def set_status(self, ctx: commands.Context, *server_names):
         """Sets the bots status to "Streaming servers running" (it's a bit weird, but that's Discord for you)
-            Checks every 5 minutes if servers are still running, unsets the status if they aren't
+            Checks at least once a minute if servers are still running (every few seconds while they change state), unsets the status if they aren't
 
         Keyword arguments:
         server_names -- optional list of running servers to print to chat
         """
 
-        SLEEP_DURATION = 5*60
-
-        if server_names:
-            Filters = [ {
-                'Name': 'tag:Spim-Managed',
-                'Values': ['true']
-            }, {
-                'Name': 'tag:Name',
-                'Values': server_names
-            } ]
-        else:
-            Filters = [ {
-                'Name': 'tag:Spim-Managed',
-                'Values': ['true']
-            } ]
+        Filters = self.server_filters(*server_names)
 
         # Set bot status to show that servers are running
         await self.bot.change_presence(activity=discord.CustomActivity('Servers running'))
 
-        # Print server list to chat
-        await self.server_list(ctx, *server_names)
-
-        running = True
-        while running:
-            running = False
-            servers = self.get_server_list(filters=Filters)
-            for _, _, status, _ in servers:
-                if status == 'running':
-                    running = True
-                    break
-            await asyncio.sleep(SLEEP_DURATION)
+        try:
+            # Print server list to chat
+            await self.server_list(ctx, *server_names)
 
-        await self.bot.change_presence(activity=None)
+            async with self.server_cache.subscribe(Filters, self.STATUS_INTERVAL) as updates:
+                async for servers in updates:
+                    if not any(server.status == 'running' for server in servers):
+                        break
+        finally:
+            # never leave the status behind, even if the servers could not be checked
+            await self.bot.change_presence(activity=None)
         embed = discord.Embed(description="Servers no longer running", timestamp=discord.utils.utcnow())
         await ctx.send(embed=embed)
 
@@ -213,20 +418,35 @@ class Spim(commands.Cog):
 
     @commands.command(name='region', parent=set, help='Set the server region')
     async def set_region(self, ctx: commands.Context, region: str):
-        """Set the server region"""
+        """Set a single server region"""
+        if await self.unknown_regions([region]):
+            await ctx.send(f'```Unknown region: {region}```')
+            return
         self.server_config['region'] = region
-        self.boto_config = botocore.config.Config(
-                region_name = self.server_config['region']
-            )
-        with open(self.server_config_path, 'w') as server_config_file:
-            dump(self.server_config, server_config_file, indent=4)
+        self.server_config['regions'] = [region]
+        self.server_cache.invalidate()
+        self.save_server_config()
+
+    @commands.command(name='regions', parent=set, help='Set every region to look for servers in')
+    async def set_regions(self, ctx: commands.Context, *regions):
+        """Set the regions servers are listed and controlled in, queried concurrently"""
+        if not regions:
+            await ctx.send('You fool! No regions specified.')
+            return
+        unknown = await self.unknown_regions(regions)
+        if unknown:
+            await ctx.send('```Unknown regions:\n' + '\n'.join(unknown) + '```')
+            return
+        self.server_config['region'] = regions[0]
+        self.server_config['regions'] = list(regions)
+        self.server_cache.invalidate()
+        self.save_server_config()
 
     @commands.command(name='url', parent=set, help='Set the dns url to use for servers')
     async def set_url(self, ctx: commands.Context, url: str):
         """Set the dns url to use for servers"""
         self.server_config['url'] = url
-        with open(self.server_config_path, 'w') as server_config_file:
-            dump(self.server_config, server_config_file, indent=4)
+        self.save_server_config()
 
     @commands.command(name='url', parent=server, help='Print the url currently used for servers managed by Spim')
     async def print_url(self, ctx: commands.Context):
@@ -237,10 +457,10 @@ class Spim(commands.Cog):
         else:
             await ctx.channel.send('`No url set`')
 
-    @commands.command(name='region', parent=server, help='Print the name of the region used in boto3 config')
+    @commands.command(name='region', parent=server, help='Print the names of the regions used in boto3 config')
     async def print_region(self, ctx: commands.Context):
-        """Print the region used for boto3 config"""
-        await ctx.channel.send(content=self.server_config['region'])
+        """Print the regions used for boto3 config"""
+        await ctx.channel.send(content=', '.join(self.regions()))
 
     @commands.command(name='list', parent=server, help='List active and inactive servers')
     async def server_list(self, ctx: commands.Context, *server_names):
@@ -250,27 +470,18 @@ class Spim(commands.Cog):
         server_names -- optional list of server names to list
         """
 
-        SLEEP_DURATION = 20
-        UPDATE_COUNT = 6
-
-        if server_names:
-            Filters = [ {
-                'Name': 'tag:Spim-Managed',
-                'Values': [ 'true' ]
-            }, {
-                'Name': 'tag:Name',
-                'Values': server_names
-            } ]
-        else:
-            Filters = [ {
-                'Name': 'tag:Spim-Managed',
-                'Values': [ 'true' ]
-            } ]
+        Filters = self.server_filters(*server_names)
 
-        timer = 0
         message = None
-        while timer < UPDATE_COUNT:
-            try:
+        shown = None
+        async with self.server_cache.subscribe(Filters, self.LIST_INTERVAL, duration=self.LIST_DURATION) as updates:
+            async for servers in updates:
+                # only touch the embed when a status or url actually changed
+                fields = [(server.name, server.status, server.url, server.region) for server in servers]
+                failed_regions = sorted(self.region_errors)
+                if (fields, failed_regions) == shown:
+                    continue
+                shown = (fields, failed_regions)
                 if 'url' in self.server_config:
                     server_dns =  self.server_config['url']
                     embed_description = 'Servers accessible through `' + server_dns + '`\n'
@@ -278,11 +489,10 @@ class Spim(commands.Cog):
                     embed_description = f"Try setting a url with `{ctx.prefix}server set url` for easier server access"
                 embed_color = await self.bot.get_embed_color(ctx)
                 embed = discord.Embed(title='Active Servers', type='rich', color=embed_color, description=embed_description, timestamp=discord.utils.utcnow())
-                servers = self.get_server_list(filters=Filters)
                 if servers:
-                    for _, name, status, url in servers:
+                    for name, status, url, region in fields:
                         if not url: url = '—————'
-                        text = f'Status: **{status}**\nURL: ```{url}```'
+                        text = f'Status: **{status}**\nRegion: `{region}`\nURL: ```{url}```'
                         embed.add_field(name=name, value=text)
                 elif len(server_names) > 1:
                     text = 'No servers found with names:'
@@ -293,15 +503,14 @@ class Spim(commands.Cog):
                 else:
                     text = 'No servers found.'
                     embed.add_field(name=text, value='')
+                if failed_regions:
+                    embed.add_field(name='Could not reach regions:', value='\n'.join(f'`{region}`' for region in failed_regions), inline=False)
 
                 if not message:
-                    message = await ctx.send(embed=embed)
+                    message = await self.actions.send(ctx, embed=embed)
                 else:
-                    await message.edit(embed=embed)
-                timer += 1
-                await asyncio.sleep(SLEEP_DURATION)
-            except Exception as e:
-                raise e
+                    # not awaited, so a slow edit never holds up the next update and queued edits are merged
+                    self.actions.edit(message, embed=embed)
 
     @commands.command(name='start', parent=server, help='Start the specified servers')
     async def server_start(self, ctx: commands.Context, *server_names):
@@ -319,31 +528,55 @@ class Spim(commands.Cog):
                 await ctx.send('You fool! No server names specified or in cache.')
                 return
 
-        Filters = [ {
-            'Name': 'tag:Spim-Managed',
-            'Values': [ 'true' ]
-        }, {
-            'Name': 'tag:Name',
-            'Values': server_names
-        } ]
-
-        try:
-            servers = self.get_server_list(filters=Filters)
-            if servers:
-                self.server_names = server_names
-                for inst_id, _, status, _ in servers:
-                    if status == 'stopped':
-                        self.start_instance(inst_id)
+        Filters = self.server_filters(*server_names)
+
+        # always act on current state, but share the request with any refresh already in flight
+        servers = await self.server_cache.get(Filters, max_age=0)
+        if servers:
+            self.server_names = server_names
+            stopped = [server for server in servers if server.status == 'stopped']
+            errors = {}
+            if stopped:
+                _, errors = await self.change_instances('start', stopped)
+            if errors:
+                await self.send_instance_errors(ctx, servers, errors)
+            if len(errors) < len(servers):
                 await self.set_status(ctx, *server_names)
-            elif len(server_names) > 1:
-                await ctx.send(f'```No servers found with names:\n' + '\n'.join(server_names) + '```')
-            else:
-                await ctx.send(f'```No server found with name:\n' + '\n'.join(server_names) + '```')
-        except botocore.exceptions.ClientError as error:
-            if error.response['Error']['Code'] == 'IncorrectSpotRequestState':
-                await ctx.send(f'```No Spot capacity available at the moment. Please try again in a few minutes.```')
+        elif len(server_names) > 1:
+            await ctx.send(f'```No servers found with names:\n' + '\n'.join(server_names) + '```')
+        else:
+            await ctx.send(f'```No server found with name:\n' + '\n'.join(server_names) + '```')
+
+    @commands.command(name='stop', parent=server, help='Stop the specified servers')
+    async def server_stop(self, ctx: commands.Context, *server_names):
+        """Stops the servers with the specified names
+            Prints the server list afterward so users can watch them shut down.
+        Keyword arguments:
+        server_names -- optional list of server names to attempt to stop, defaults to the last servers started
+        """
+
+        if not server_names:
+            if self.server_names:
+                server_names = self.server_names
             else:
-                raise error
+                await ctx.send('You fool! No server names specified or in cache.')
+                return
+
+        Filters = self.server_filters(*server_names)
+
+        servers = await self.server_cache.get(Filters, max_age=0)
+        if servers:
+            running = [server for server in servers if server.status in ('pending', 'running')]
+            errors = {}
+            if running:
+                _, errors = await self.change_instances('stop', running)
+            if errors:
+                await self.send_instance_errors(ctx, servers, errors)
+            await self.server_list(ctx, *server_names)
+        elif len(server_names) > 1:
+            await ctx.send(f'```No servers found with names:\n' + '\n'.join(server_names) + '```')
+        else:
+            await ctx.send(f'```No server found with name:\n' + '\n'.join(server_names) + '```')
 
     #################
     # LIST COMMANDS #
@@ -351,29 +584,40 @@ class Spim(commands.Cog):
 
     @commands.group(name='list', invoke_without_command=True)
     async def manage_list(self, ctx: commands.Context, name):
-        """Prints the list with the given name"""
+        """Prints the list with the given name, one page at a time"""
         embed_color = await self.bot.get_embed_color(ctx)
-        list_text = ''
-        if name in self.lists:
-            for item in self.lists[name]:
-                list_text += f"• {item}\n"
-            embed = discord.Embed(title=name, description=list_text, color=embed_color)
+        await ListView(self.lists, name, embed_color).send(ctx)
+
+    @commands.command(name='search', parent=manage_list, help='Search for items across every list')
+    async def list_search(self, ctx: commands.Context, *query):
+        """Search every list for items containing the query, or close to it"""
+        MAX_RESULTS = 25
+
+        embed_color = await self.bot.get_embed_color(ctx)
+        query = ' '.join(query)
+        if not query:
+            await ctx.send(embed=discord.Embed(description='No search query given', color=embed_color))
+            return
+        results = self.lists.search(query, limit=MAX_RESULTS)
+        if results:
+            lines = []
+            for name, item in results:
+                if len(item) > ListView.ITEM_LENGTH:
+                    item = item[:ListView.ITEM_LENGTH - 1] + '…'
+                lines.append(f"• {item} — *{name}*")
+            embed = discord.Embed(title=f"Results for {query}"[:256], description='\n'.join(lines), color=embed_color)
         else:
-            embed = discord.Embed(description='List not found', color=embed_color)
+            embed = discord.Embed(description=f"No items found matching **{query}**", color=embed_color)
         await ctx.send(embed=embed)
 
     @commands.command(name='add', parent=manage_list, help='Add items to a list')
     async def list_add(self, ctx: commands.Context, name, *items):
         """Add items to a list"""
         embed_color = await self.bot.get_embed_color(ctx)
-        if items:
-            items = list(items)
-        if name in self.lists:
-            self.lists[name].extend(items)
-        else:
-            self.lists[name] = list(items)
-        with open(self.list_path, 'w') as list_file:
-            dump(self.lists, list_file, indent=4)
+        items = list(items)
+        async with self.perf.external('file'):
+            self.lists.add(name, items)
+            await self.lists.compact_if_due(name)
         if len(items) > 1:
             embed = discord.Embed(description=f"Added **{len(items)}** items to **{name}**", color=embed_color)
         else:
@@ -387,30 +631,130 @@ class Spim(commands.Cog):
         if name in self.lists:
             if items:
                 items = list(items)
-                for item in items:
-                    if not item in self.lists[name]:
-                        await ctx.send(embed=discord.Embed(description=f"**{item}** not found in **{name}**", color=embed_color))
-                        return
-                self.lists[name] = [item for item in self.lists[name] if item not in items]
-                with open(self.list_path, 'w') as list_file:
-                    dump(self.lists, list_file, indent=4)
+                missing = self.lists.missing(name, items)
+                if missing:
+                    await ctx.send(embed=discord.Embed(description=f"**{missing[0]}** not found in **{name}**", color=embed_color))
+                    return
+                async with self.perf.external('file'):
+                    self.lists.remove(name, items)
+                    await self.lists.compact_if_due(name)
                 if len(items) > 1:
                     embed = discord.Embed(description=f"Removed **{len(items)}** items from **{name}**", color=embed_color)
                 else:
                     embed = discord.Embed(description=f"Removed **{len(items)}** item from **{name}**", color=embed_color)
             else:
-                self.lists.pop(name)
+                with self.perf.external('file'):
+                    self.lists.delete(name)
                 embed = discord.Embed(description=f"Deleted **{name}**", color=embed_color)
-            with open(self.list_path, 'w') as list_file:
-                dump(self.lists, list_file, indent=4)
         else:
             embed = discord.Embed(description=f"List not found", color=embed_color)
         await ctx.send(embed=embed)
 
+    #################
+    # PERF COMMANDS #
+    #################
+
+    @commands.is_owner()
+    @commands.group(name='perf', invoke_without_command=True, help='Show the slowest commands and listeners')
+    async def perf_report(self, ctx: commands.Context, count: int = 10):
+        """Show the commands and listeners with the slowest 95th percentile wall time since Spim was loaded, with their average AWS API calls per run
+
+        Keyword arguments:
+        count -- number of commands and listeners to show
+        """
+        profiles = sorted(self.perf.profiles.values(), key=lambda profile: profile.wall.percentile(0.95), reverse=True)[:count]
+        if not profiles:
+            await ctx.send('```No commands have run yet```')
+            return
+        lines = [f"{'command':<28}{'runs':>6}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'block p95':>11}{'api/run':>9}  external avg ms"]
+        for profile in profiles:
+            wall = profile.wall
+            external = ' '.join(f'{kind} {seconds / wall.count * 1000:.0f}' for kind, seconds in profile.external.most_common())
+            api_calls = sum(profile.api_calls.values()) / wall.count
+            lines.append(
+                f"{profile.cog + '.' + profile.name:<28.28}{wall.count:>6}{wall.percentile(0.5) * 1000:>9.0f}"
+                f"{wall.percentile(0.95) * 1000:>9.0f}{wall.max * 1000:>9.0f}{profile.blocking.percentile(0.95) * 1000:>11.0f}{api_calls:>9.1f}  {external}"
+            )
+        await ctx.send('```' + '\n'.join(lines) + '```')
+
+    @commands.command(name='startup', parent=perf_report, help='Show how long each cog took to start')
+    async def perf_startup(self, ctx: commands.Context):
+        """Show the time each cog from this repository spent in each startup phase"""
+        lines = []
+        for name in ('Roller', 'Scheduler', 'Spim'):
+            cog = self.bot.get_cog(name)
+            if cog is None or not getattr(cog, 'startup_times', None):
+                continue
+            phases = ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in cog.startup_times.items())
+            lines.append(f'{name}: {phases}')
+        await ctx.send('```' + ('\n'.join(lines) or 'No startup times recorded') + '```')
+
+    @commands.command(name='profile', parent=perf_report, help='Sample the event loop and save the profile')
+    async def perf_profile(self, ctx: commands.Context, seconds: float = 30.0):
+        """Sample the stack of the event loop thread for a while and save it in collapsed stack format to the cog data directory
+
+        Keyword arguments:
+        seconds -- number of seconds to sample for, at most 300
+        """
+        seconds = min(max(seconds, 1.0), 300.0)
+        await ctx.send(f'Profiling the event loop for {seconds:g} seconds...')
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
+
+        profile_dir = os.path.join(data_manager.cog_data_path(self), 'profiles')
+        profile_path = os.path.join(profile_dir, strftime('profile-%Y%m%d-%H%M%S.txt'))
+        def write_profile():
+            os.makedirs(profile_dir, exist_ok=True)
+            with open(profile_path, 'w') as profile_file:
+                for stack, samples in stacks.most_common():
+                    profile_file.write(f'{stack} {samples}\n')
+        await asyncio.to_thread(write_profile)
+
+        # the innermost function of each stack is where the loop was actually spending its time
+        leaves = Counter()
+        for stack, samples in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        total = sum(leaves.values()) or 1
+        top = '\n'.join(f'{samples / total:>6.1%}  {leaf}' for leaf, samples in leaves.most_common(10))
+        await ctx.send(f'Saved `{profile_path}`\n```{top}```')
+
+    @commands.command(name='stalls', parent=perf_report, help='Show recent event loop stalls and what caused them')
+    async def perf_stalls(self, ctx: commands.Context, count: int = 5):
+        """Show event loop lag, which cogs and commands stalled the loop most, and the most recent stalls
+
+        Keyword arguments:
+        count -- number of recent stalls to show with their stacks
+        """
+        MESSAGE_LIMIT = 2000
+        FRAME_COUNT = 4
+
+        lag = self.watchdog.lag
+        lines = [
+            f'Loop lag: p50 {lag.percentile(0.5) * 1000:.0f} ms, p95 {lag.percentile(0.95) * 1000:.0f} ms, max {lag.max * 1000:.0f} ms',
+            f'Stalls over {self.watchdog.threshold * 1000:.0f} ms: {len(self.watchdog.stalls)} recorded',
+        ]
+        totals = Counter()
+        for stall in self.watchdog.stalls:
+            totals[(stall.cog or '?', stall.command or '-')] += stall.duration
+        for (cog, command), seconds in totals.most_common():
+            lines.append(f'  {cog}.{command}: {seconds * 1000:.0f} ms')
+        for stall in list(self.watchdog.stalls)[-count:][::-1] if count > 0 else []:
+            lines.append('')
+            lines.append(f"{strftime('%H:%M:%S', localtime(stall.started))} {stall.duration * 1000:.0f} ms in {stall.cog or '?'}.{stall.command or '-'} at {stall.where or '?'}")
+            lines += [f'    {frame}' for frame in stall.stack[-FRAME_COUNT:]]
+        text = '\n'.join(lines)
+        if len(text) > MESSAGE_LIMIT - 6:
+            text = text[:MESSAGE_LIMIT - 7] + '…'
+        await ctx.send('```' + text + '```')
+
     ###################
     # EVENT LISTENERS #
     ###################
 
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog: commands.Cog):
+        # instrument cogs from this repository that are loaded or reloaded after Spim
+        self.perf.instrument(cog)
+
     #########################
     # CONTEXT MENU COMMANDS #
     #########################
@@ -423,7 +767,7 @@ async def spimify(inter: discord.Interaction, message: discord.Message):
 
     spims = ['<:spimPog:772261869858848779>', '<:spimPogR:775434707231047680>', '<:spimBall:1066624826086793366>', '<:spimPride:988519886479327242>', '<:spimThink:949780590121607209>', '<:spinta:1041857241600507924>']
     shuffle(spims)
-    for s in spims:
-        await message.add_reaction(s)
+    cog = inter.client.get_cog('Spim')
+    await cog.actions.add_reactions(message, spims)
     
     await inter.delete_original_response()
\ No newline at end of file
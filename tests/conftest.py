@@ -0,0 +1,135 @@
+import asyncio
+import gc
+from collections import Counter
+
+import pytest
+from moto import mock_aws
+from redbot.core import data_manager
+from redbot.core.config import Config
+
+from spim import servers
+from spim.perf import StallWatchdog
+from spim.spim import DEFAULT_REGION, Spim
+
+from .fakes import FakeBot, FakeContext
+from .harness import BLOCK_THRESHOLD, assert_loop_responsive
+
+# any image id is accepted by moto
+IMAGE_ID = 'ami-12345678'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Stand in for EC2 with moto, so no request leaves the machine"""
+
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SECURITY_TOKEN', 'AWS_SESSION_TOKEN'):
+        monkeypatch.setenv(name, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', DEFAULT_REGION)
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def launch(aws):
+    """Launch one instance per name in moto
+
+    Keyword arguments:
+    names -- Name tag of each instance
+    region -- region to launch in
+    managed -- whether to set the Spim-Managed tag
+    state -- either 'running' or 'stopped'
+    Return: list of instance ids
+    """
+
+    import boto3
+
+    def launch(*names, region=DEFAULT_REGION, managed=True, state='running'):
+        ec2 = boto3.client('ec2', region_name=region)
+        inst_ids = []
+        for name in names:
+            tags = [{'Key': 'Name', 'Value': name}]
+            if managed:
+                tags.append({'Key': 'Spim-Managed', 'Value': 'true'})
+            reservation = ec2.run_instances(
+                ImageId=IMAGE_ID, MinCount=1, MaxCount=1,
+                TagSpecifications=[{'ResourceType': 'instance', 'Tags': tags}],
+            )
+            inst_ids += [instance['InstanceId'] for instance in reservation['Instances']]
+        if state == 'stopped':
+            ec2.stop_instances(InstanceIds=inst_ids)
+        return inst_ids
+    return launch
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+
+@pytest.fixture
+def ctx(bot):
+    return FakeContext(bot)
+
+
+@pytest.fixture
+def spim(aws, bot, tmp_path, monkeypatch):
+    """Spim cog with its data in a temporary directory and polling sped up to a test's time scale"""
+
+    monkeypatch.setattr(data_manager, 'cog_data_path', lambda *args, **kwargs: tmp_path)
+    monkeypatch.setattr(Config, 'get_conf', classmethod(lambda cls, *args, **kwargs: None))
+    monkeypatch.setattr(servers, 'MIN_POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(Spim, 'STATUS_INTERVAL', 0.2)
+    monkeypatch.setattr(Spim, 'LIST_INTERVAL', 0.2)
+    monkeypatch.setattr(Spim, 'LIST_DURATION', 0.5)
+    cog = Spim(bot)
+    cog.watchdog = StallWatchdog(cog.perf, threshold=BLOCK_THRESHOLD, interval=0.01)
+    return cog
+
+
+@pytest.fixture
+def api_calls(spim, monkeypatch):
+    """Counter of every EC2 API call made by the cog, by operation name"""
+
+    calls = Counter()
+    watch = spim.perf.watch
+
+    def count(model, **kwargs):
+        calls[model.name] += 1
+
+    def watch_and_count(client):
+        watch(client)
+        client.meta.events.register('before-call.ec2', count)
+
+    # every EC2 client the cog creates is handed to PerfRecorder.watch
+    monkeypatch.setattr(spim.perf, 'watch', watch_and_count)
+    return calls
+
+
+@pytest.fixture
+def run(spim, bot):
+    """Run a coroutine function on a new event loop with the cog loaded, then check the loop was never blocked"""
+
+    def run(scenario):
+        async def main():
+            # like Red, the cog is only added to the bot, and its commands bound to it, once cog_load returns
+            await spim.cog_load()
+            for command in spim.walk_commands():
+                command.cog = spim
+            bot.cogs['Spim'] = spim
+            await spim.wait_until_ready()
+            try:
+                return await scenario()
+            finally:
+                spim.cog_unload()
+
+        # moto keeps every fake instance in this process, so a full collection can pause every thread for
+        # hundreds of milliseconds, collect up front and hold off until the end so those pauses are not blamed on the cog
+        gc.collect()
+        gc.disable()
+        try:
+            result = asyncio.run(main())
+        finally:
+            gc.enable()
+        assert_loop_responsive(spim.watchdog)
+        return result
+    return run
@@ -0,0 +1,82 @@
+from itertools import count
+from types import SimpleNamespace
+
+import discord
+
+_ids = count(1000)
+
+
+class FakeMessage:
+    """Message that records every edit made to it"""
+
+    def __init__(self, channel: 'FakeChannel', content=None, **kwargs) -> None:
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = kwargs.get('embed')
+        self.edits: list[dict] = []
+        self.reactions: list = []
+
+    async def edit(self, **kwargs) -> 'FakeMessage':
+        self.edits.append(kwargs)
+        if 'embed' in kwargs:
+            self.embed = kwargs['embed']
+        return self
+
+    async def delete(self) -> None:
+        pass
+
+    async def add_reaction(self, emoji) -> None:
+        self.reactions.append(emoji)
+
+
+class FakeChannel:
+    """Text channel that records every message sent to it"""
+
+    def __init__(self) -> None:
+        self.id = next(_ids)
+        self.sent: list[FakeMessage] = []
+
+    async def send(self, content=None, **kwargs) -> FakeMessage:
+        message = FakeMessage(self, content, **kwargs)
+        self.sent.append(message)
+        return message
+
+
+class FakeContext:
+    """Command context with just enough of commands.Context for the server commands"""
+
+    def __init__(self, bot: 'FakeBot') -> None:
+        self.bot = bot
+        self.channel = FakeChannel()
+        self.message = FakeMessage(self.channel)
+        self.prefix = '[p]'
+        self.command = None
+
+    @property
+    def sent(self) -> list[FakeMessage]:
+        return self.channel.sent
+
+    async def send(self, content=None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeBot:
+    """Bot that records presence changes, with an HTTP client for PerfRecorder to wrap"""
+
+    def __init__(self) -> None:
+        self.cogs: dict = {}
+        self.presences: list = []
+        self.http = SimpleNamespace(request=self._request)
+
+    async def _request(self, *args, **kwargs) -> None:
+        raise AssertionError('the fake context never makes real Discord requests')
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    async def change_presence(self, activity=None) -> None:
+        self.presences.append(activity)
+
+    async def get_embed_color(self, location) -> discord.Color:
+        return discord.Color.red()
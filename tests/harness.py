@@ -0,0 +1,30 @@
+from time import perf_counter
+
+# longest the event loop may be blocked for while a server command runs, in seconds
+BLOCK_THRESHOLD = 0.05
+
+
+async def invoke(cog, ctx, command, *args) -> float:
+    """Run a command with the cog's invoke hooks around it, the way Red does
+
+    Return: wall time of the command in seconds
+    """
+
+    ctx.command = command
+    start = perf_counter()
+    await cog.cog_before_invoke(ctx)
+    try:
+        await command(ctx, *args)
+    finally:
+        await cog.cog_after_invoke(ctx)
+    return perf_counter() - start
+
+
+def assert_loop_responsive(watchdog) -> None:
+    """Fail if the watchdog saw the event loop blocked for longer than its threshold"""
+
+    stalls = [
+        f"{stall.duration * 1000:.0f} ms in {stall.cog}.{stall.command} at {stall.where}: {' <- '.join(reversed(stall.stack[-4:]))}"
+        for stall in watchdog.stalls
+    ]
+    assert not stalls, 'event loop stalled: ' + '; '.join(stalls)
@@ -0,0 +1,46 @@
+import asyncio
+
+from scheduler.scheduler import Scheduler
+from spim import actions
+from spim.actions import ActionQueue
+
+from .fakes import FakeBot, FakeChannel
+
+
+def test_idle_buckets_are_dropped_once_full(monkeypatch):
+    monkeypatch.setitem(actions.ROUTE_LIMITS, 'send', (2, 0.05))
+
+    async def scenario():
+        queue = ActionQueue()
+        channel = FakeChannel()
+        await asyncio.gather(*(queue.send(channel, content=str(i)) for i in range(3)))
+        assert (channel.id, 'send') in queue._buckets
+        await asyncio.sleep(0.1)
+        return queue, channel
+
+    queue, channel = asyncio.run(scenario())
+    assert len(channel.sent) == 3
+    assert queue._buckets == {}
+
+
+def test_scheduler_reactions_survive_spim_unloading(tmp_path, monkeypatch):
+    monkeypatch.setattr(actions, 'ROUTE_LIMITS', {'reaction': (1, 60.0)})
+    monkeypatch.setattr('redbot.core.data_manager.cog_data_path', lambda *args, **kwargs: tmp_path)
+    EMOJIS = ['👍', '👎']
+
+    async def scenario():
+        bot = FakeBot()
+        queue = ActionQueue()
+        bot.cogs['Spim'] = type('Spim', (), {'actions': queue})()
+        scheduler = Scheduler(bot)
+        message = await FakeChannel().send('reminder')
+        await scheduler.add_reactions(message, *EMOJIS)
+        # the first reaction takes the only token, so the second is still queued when Spim unloads
+        await asyncio.sleep(0.01)
+        queue.close()
+        del bot.cogs['Spim']
+        await asyncio.sleep(0.01)
+        return message
+
+    message = asyncio.run(scenario())
+    assert EMOJIS[1] in message.reactions
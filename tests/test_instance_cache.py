@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from spim import servers
+from spim.servers import MAX_FAILURES, InstanceStateCache, ServerRecord
+
+RUNNING = [ServerRecord('i-1', 'alpha', 'running', '', 'us-west-2')]
+STOPPED = [ServerRecord('i-1', 'alpha', 'stopped', '', 'us-west-2')]
+
+
+class Throttled(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(servers, 'MIN_POLL_INTERVAL', 0.01)
+
+
+async def collect(cache, interval=0.02):
+    """Iterate over a subscription until it ends, returning every list of servers and the error it ended with"""
+
+    seen = []
+    try:
+        async with cache.subscribe([], interval) as updates:
+            async for update in updates:
+                seen.append(update)
+                if update == STOPPED:
+                    break
+    except Throttled as e:
+        return seen, e
+    return seen, None
+
+
+def test_transient_errors_keep_the_last_servers():
+    # two throttled refreshes in a row, then the servers stop
+    results = iter([RUNNING] + [Throttled()] * (MAX_FAILURES - 1) + [STOPPED])
+
+    async def fetch(filters):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def scenario():
+        cache = InstanceStateCache(fetch, ttl=0)
+        return await asyncio.wait_for(asyncio.gather(collect(cache), collect(cache)), 5)
+
+    for seen, error in asyncio.run(scenario()):
+        assert seen == [RUNNING, STOPPED]
+        assert error is None
+
+
+def test_repeated_errors_reach_subscribers():
+    calls = 0
+
+    async def fetch(filters):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise Throttled()
+        return RUNNING
+
+    async def scenario():
+        cache = InstanceStateCache(fetch, ttl=0)
+        return await asyncio.wait_for(collect(cache), 5)
+
+    seen, error = asyncio.run(scenario())
+    assert seen == [RUNNING]
+    assert isinstance(error, Throttled)
+    assert calls == 1 + MAX_FAILURES
+
+
+def test_unused_entries_are_evicted():
+    async def fetch(filters):
+        return RUNNING
+
+    async def scenario():
+        cache = InstanceStateCache(fetch, ttl=0)
+        for name in range(100):
+            await cache.get([{'Name': 'tag:Name', 'Values': [str(name)]}])
+            await asyncio.sleep(0.001)
+        return cache
+
+    assert len(asyncio.run(scenario())._entries) == 1
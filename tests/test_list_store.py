@@ -0,0 +1,47 @@
+import asyncio
+
+from spim.lists import ListStore
+
+
+def journal_lines(store, name) -> int:
+    with open(f'{store.path}/{store.files[name]}') as journal:
+        return sum(1 for _ in journal)
+
+
+def test_compaction_threshold_grows_with_the_list(tmp_path):
+    ITEMS = 1000
+
+    store = ListStore(str(tmp_path))
+    store.load()
+    store.add('big', [str(i) for i in range(ITEMS)])
+    # one entry per item, only as many as the list has items
+    for i in range(ITEMS):
+        store.add('big', [str(i % ITEMS)])
+    asyncio.run(store.compact_if_due('big'))
+    assert journal_lines(store, 'big') == ITEMS + 1
+
+    for i in range(ITEMS + ListStore.COMPACT_SLACK):
+        store.add('big', [str(i % ITEMS)])
+    asyncio.run(store.compact_if_due('big'))
+    assert journal_lines(store, 'big') == 1
+
+
+def test_changes_made_while_compacting_are_kept(tmp_path):
+    store = ListStore(str(tmp_path))
+    store.load()
+    for i in range(ListStore.COMPACT_SLACK + 5):
+        store.add('small', ['kept', 'removed'])
+
+    async def scenario():
+        compaction = asyncio.create_task(store.compact_if_due('small'))
+        # let the compaction take its snapshot and hand the write to a worker thread
+        await asyncio.sleep(0)
+        store.add('small', ['added'])
+        store.remove('small', ['removed'])
+        await compaction
+    asyncio.run(scenario())
+
+    assert journal_lines(store, 'small') == 3
+    reloaded = ListStore(str(tmp_path))
+    reloaded.load()
+    assert reloaded.lists == store.lists == {'small': {'kept': ListStore.COMPACT_SLACK + 5, 'added': 1}}
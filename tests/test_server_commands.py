@@ -0,0 +1,217 @@
+import asyncio
+
+import boto3
+import discord
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from spim.servers import ServerRecord
+from spim.spim import DEFAULT_REGION, INSTANCE_BATCH_SIZE
+
+from .fakes import FakeContext
+from .harness import invoke
+
+# wall time budgets in seconds, generous enough for a slow CI machine but far below the real polling intervals
+LIST_WALL_BUDGET = 2.0
+START_WALL_BUDGET = 5.0
+# describe_instances calls allowed while one server list updates for Spim.LIST_DURATION
+LIST_DESCRIBE_BUDGET = 6
+
+
+def field_names(message) -> list[str]:
+    return sorted(field.name for field in message.embed.fields)
+
+
+async def stop_when_announced(bot, inst_ids, region=DEFAULT_REGION) -> None:
+    """Stop instances from outside the cog once it has set the running status"""
+
+    def stop():
+        boto3.client('ec2', region_name=region).stop_instances(InstanceIds=inst_ids)
+
+    while not bot.presences:
+        await asyncio.sleep(0.01)
+    # boto3 blocks, so keep it off the loop like the cog does
+    await asyncio.to_thread(stop)
+
+
+def test_server_list_shows_managed_servers(spim, ctx, run, launch, api_calls):
+    launch('alpha', 'beta')
+    launch('unmanaged', managed=False)
+
+    wall = run(lambda: invoke(spim, ctx, spim.server_list))
+
+    assert len(ctx.sent) == 1
+    assert field_names(ctx.sent[0]) == ['alpha', 'beta']
+    # nothing changed while the list was updating, so the embed is never edited
+    assert ctx.sent[0].edits == []
+    assert 1 <= api_calls['DescribeInstances'] <= LIST_DESCRIBE_BUDGET
+    assert set(api_calls) == {'DescribeInstances'}
+    assert wall < LIST_WALL_BUDGET
+
+
+def test_concurrent_server_lists_share_describe_calls(spim, bot, run, launch, api_calls):
+    LISTS = 5
+
+    launch('alpha')
+    contexts = [FakeContext(bot) for _ in range(LISTS)]
+
+    async def scenario():
+        await asyncio.gather(*(invoke(spim, ctx, spim.server_list) for ctx in contexts))
+    run(scenario)
+
+    assert all(field_names(ctx.sent[0]) == ['alpha'] for ctx in contexts)
+    # every list is served by the same cache entry, so they cost as much as a single one
+    assert api_calls['DescribeInstances'] <= LIST_DESCRIBE_BUDGET
+
+
+def test_server_list_queries_every_region(spim, ctx, run, launch, api_calls):
+    REGIONS = [DEFAULT_REGION, 'eu-west-1']
+
+    launch('west')
+    launch('europe', region='eu-west-1')
+
+    async def scenario():
+        await invoke(spim, ctx, spim.set_regions, *REGIONS)
+        await invoke(spim, ctx, spim.server_list)
+    run(scenario)
+
+    assert field_names(ctx.sent[0]) == ['europe', 'west']
+    regions = {field.name: field.value for field in ctx.sent[0].embed.fields}
+    assert '`eu-west-1`' in regions['europe']
+    # one describe per region per refresh
+    assert len(REGIONS) <= api_calls['DescribeInstances'] <= LIST_DESCRIBE_BUDGET * len(REGIONS)
+
+
+def test_server_list_shows_servers_in_reachable_regions(spim, ctx, run, launch, api_calls):
+    REGIONS = [DEFAULT_REGION, 'eu-west-1']
+
+    launch('west')
+    launch('europe', region='eu-west-1')
+
+    def unreachable(**kwargs):
+        raise EndpointConnectionError(endpoint_url='https://ec2.eu-west-1.amazonaws.com/')
+
+    async def scenario():
+        await invoke(spim, ctx, spim.set_regions, *REGIONS)
+        ec2 = await asyncio.to_thread(spim.ec2_client, 'eu-west-1')
+        ec2.meta.events.register('before-send.ec2.DescribeInstances', unreachable)
+        await invoke(spim, ctx, spim.server_list)
+    run(scenario)
+
+    fields = {field.name: field.value for field in ctx.sent[0].embed.fields}
+    assert 'west' in fields
+    assert fields['Could not reach regions:'] == '`eu-west-1`'
+
+
+def test_set_regions_rejects_unknown_regions(spim, ctx, run):
+    # parsing boto3's endpoint data holds the GIL, do it before the scenario like the tests that launch instances
+    boto3.client('ec2', region_name=DEFAULT_REGION)
+
+    async def scenario():
+        await invoke(spim, ctx, spim.set_regions, DEFAULT_REGION, 'us-wset-2')
+    run(scenario)
+
+    assert ctx.sent[0].content == '```Unknown regions:\nus-wset-2```'
+    assert spim.regions() == [DEFAULT_REGION]
+    assert 'regions' not in spim.server_config
+
+
+def test_server_start_starts_stopped_servers_and_tracks_them(spim, bot, ctx, run, launch, api_calls):
+    inst_ids = launch('alpha', 'beta', state='stopped')
+
+    async def scenario():
+        stopper = asyncio.create_task(stop_when_announced(bot, inst_ids))
+        wall = await asyncio.wait_for(invoke(spim, ctx, spim.server_start, 'alpha', 'beta'), START_WALL_BUDGET)
+        await stopper
+        return wall
+    run(scenario)
+
+    assert api_calls['StartInstances'] == 1
+    # the start is charged to the command, the shared refreshes to no command at all
+    profile = spim.perf.profiles[('Spim', 'server start')]
+    assert profile.api_calls['StartInstances'] == 1
+    assert profile.wall.count == 1
+    assert isinstance(bot.presences[0], discord.CustomActivity)
+    assert bot.presences[-1] is None
+    assert field_names(ctx.sent[0]) == ['alpha', 'beta']
+    assert ctx.sent[-1].embed.description == 'Servers no longer running'
+
+
+def test_server_start_batches_large_fleets(spim, bot, ctx, run, launch, api_calls):
+    SERVERS = 120
+
+    names = [f'server-{i}' for i in range(SERVERS)]
+    inst_ids = launch(*names, state='stopped')
+
+    async def scenario():
+        stopper = asyncio.create_task(stop_when_announced(bot, inst_ids))
+        await asyncio.wait_for(invoke(spim, ctx, spim.server_start, *names), START_WALL_BUDGET)
+        await stopper
+    run(scenario)
+
+    assert api_calls['StartInstances'] == -(-SERVERS // INSTANCE_BATCH_SIZE)
+    assert len(ctx.sent[0].embed.fields) == SERVERS
+
+
+def test_server_start_does_not_retry_throttled_batches(spim, ctx, run, launch, api_calls):
+    launch('alpha', 'beta', 'gamma', state='stopped')
+
+    def throttle(**kwargs):
+        raise ClientError({'Error': {'Code': 'RequestLimitExceeded', 'Message': 'Request limit exceeded.'}}, 'StartInstances')
+
+    async def scenario():
+        ec2 = await asyncio.to_thread(spim.ec2_client, DEFAULT_REGION)
+        ec2.meta.events.register('before-send.ec2.StartInstances', throttle)
+        await invoke(spim, ctx, spim.server_start, 'alpha', 'beta', 'gamma')
+    run(scenario)
+
+    assert api_calls['StartInstances'] == 1
+    assert ctx.sent[0].content.count('Request limit exceeded.') == 3
+
+
+def test_failed_instances_are_found_by_splitting_the_batch(spim, run, launch, api_calls):
+    inst_ids = launch('alpha', 'beta', 'gamma', state='stopped')
+    servers = [ServerRecord(inst_id, inst_id, 'stopped', '', DEFAULT_REGION) for inst_id in inst_ids]
+    servers.append(ServerRecord('i-0123456789abcdef0', 'missing', 'stopped', '', DEFAULT_REGION))
+
+    changes, errors = run(lambda: spim.change_instances('start', servers))
+
+    assert sorted(change['InstanceId'] for change in changes) == sorted(inst_ids)
+    assert list(errors) == ['i-0123456789abcdef0']
+    # the whole batch, then both halves, then both quarters of the half with the missing instance
+    assert api_calls['StartInstances'] == 5
+
+
+def test_server_start_reports_missing_servers(spim, ctx, run, launch, api_calls):
+    launch('alpha')
+
+    run(lambda: invoke(spim, ctx, spim.server_start, 'missing'))
+
+    assert ctx.sent[0].content == '```No server found with name:\nmissing```'
+    assert 'StartInstances' not in api_calls
+
+
+def test_set_status_clears_presence_when_servers_stop(spim, bot, ctx, run, launch, api_calls):
+    inst_ids = launch('alpha')
+
+    async def scenario():
+        stopper = asyncio.create_task(stop_when_announced(bot, inst_ids))
+        await asyncio.wait_for(spim.set_status(ctx, 'alpha'), START_WALL_BUDGET)
+        await stopper
+    run(scenario)
+
+    assert isinstance(bot.presences[0], discord.CustomActivity)
+    assert bot.presences[-1] is None
+    assert ctx.sent[-1].embed.description == 'Servers no longer running'
+    assert set(api_calls) == {'DescribeInstances'}
+
+
+def test_server_stop_stops_running_servers(spim, ctx, run, launch, api_calls):
+    launch('alpha', 'beta')
+    launch('gamma', state='stopped')
+
+    wall = run(lambda: invoke(spim, ctx, spim.server_stop, 'alpha', 'beta', 'gamma'))
+
+    assert api_calls['StopInstances'] == 1
+    statuses = {field.name: field.value for field in ctx.sent[0].embed.fields}
+    assert all('**stopped**' in status for status in statuses.values())
+    assert wall < LIST_WALL_BUDGET